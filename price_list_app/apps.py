@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class PriceListAppConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'price_list_app'
+
+    def ready(self):
+        from .signals import connect_signals
+        connect_signals()
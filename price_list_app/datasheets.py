@@ -0,0 +1,55 @@
+import os
+import threading
+
+import pandas as pd
+from django.conf import settings
+
+datasheet_file_path = os.path.join(settings.BASE_DIR, 'data', 'datasheet.csv')
+
+# Product name -> datasheet URL, shared by every request of this process. The
+# file is parsed on first use and again whenever its mtime or size changes,
+# e.g. after update_csv_view stored a new datasheet.csv.
+_lock = threading.Lock()
+_cached = (None, {})
+
+
+def normalize_product_name(name):
+    """Key under which a product name is looked up: surrounding whitespace
+    dropped, inner runs collapsed to one space, case folded."""
+    return ' '.join(str(name).split()).casefold()
+
+
+def _signature():
+    try:
+        stat = os.stat(datasheet_file_path)
+    except OSError:
+        return None
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _read_links():
+    df = pd.read_csv(datasheet_file_path, dtype=str, keep_default_na=False)
+    links = {}
+    for name, link in zip(df['Product Name'], df['link']):
+        if name.strip() and link.strip():
+            links[normalize_product_name(name)] = link.strip()
+    return links
+
+
+def datasheet_links():
+    """Return the current {normalized product name: URL} index. The dict is
+    shared and must not be modified."""
+    global _cached
+    signature, links = _cached
+    if signature != _signature():
+        with _lock:
+            signature = _signature()
+            if _cached[0] != signature:
+                _cached = (signature, _read_links() if signature else {})
+            links = _cached[1]
+    return links
+
+
+def datasheet_link(product_name):
+    """Return the datasheet URL of a product, or None."""
+    return datasheet_links().get(normalize_product_name(product_name))
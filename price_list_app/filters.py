@@ -0,0 +1,221 @@
+from datetime import datetime, timedelta
+
+import numpy as np
+import pandas as pd
+
+# Filter key -> (column, bound) of the inclusive min/max filters.
+range_filters = {
+    'panel_power_min': ('panel_power', 'min'), 'panel_power_max': ('panel_power', 'max'),
+    'length_min': ('length', 'min'), 'length_max': ('length', 'max'),
+    'height_min': ('height', 'min'), 'height_max': ('height', 'max'),
+    'width_min': ('width', 'min'), 'width_max': ('width', 'max'),
+    'available': ('available', 'min'),
+    'power_available': ('power_available', 'min'),
+}
+
+
+def _take(values, rows):
+    return values if rows is None else values[rows]
+
+
+def _isin(name, values):
+    def predicate(df, rows):
+        column = df[name]
+        # Categorical columns are matched on their codes, so the strings of
+        # each row are never compared.
+        if isinstance(column.dtype, pd.CategoricalDtype):
+            wanted = np.flatnonzero(column.cat.categories.isin(values))
+            return np.isin(_take(column.cat.codes.to_numpy(), rows), wanted)
+        return _take(column.isin(values).to_numpy(), rows)
+    return predicate
+
+
+def _compare(name, op, value):
+    def predicate(df, rows):
+        return op(_take(df[name].to_numpy(), rows), value)
+    return predicate
+
+
+def _per_unit(name, minimum):
+    # available / pcs_pal >= n, with a zero unit giving inf or NaN as before
+    def predicate(df, rows):
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return _take(df['available'].to_numpy(), rows) / _take(df[name].to_numpy(), rows) >= minimum
+    return predicate
+
+
+def compile_filters(filters, selected_groups=None, selected_brands=None):
+    """Compile a Configuration.filters dict into (ranges, memberships,
+    predicates).
+
+    ranges maps a column to its inclusive (low, high) bounds, None when open;
+    they can be resolved through a sorted range index. memberships maps a
+    column to the values it must be one of; they can be resolved through
+    bitmap indexes. Each predicate takes a frame shaped like get_inventory()
+    and an array of row positions (None for every row) and returns the
+    boolean mask of those rows. selected_groups and selected_brands are
+    skipped when None.
+    """
+    ranges = {}
+    memberships = {}
+    predicates = []
+
+    if selected_groups is not None:
+        memberships['Group'] = selected_groups
+    if selected_brands is not None:
+        memberships['brand'] = selected_brands
+
+    if filters.get('no_delivery_date'):
+        predicates.append(lambda df, rows: np.isnat(_take(df['delivery_month'].to_numpy(), rows)))
+    else:
+        if filters.get('delivery_month_start'):
+            predicates.append(_compare('delivery_month', np.greater_equal, np.datetime64(filters['delivery_month_start'], 'M')))
+        if filters.get('delivery_month_end'):
+            predicates.append(_compare('delivery_month', np.less, np.datetime64(filters['delivery_month_end'], 'M') + 1))
+    for key, (column, bound) in range_filters.items():
+        if filters.get(key) is not None:
+            low, high = ranges.get(column, (None, None))
+            if bound == 'min':
+                low = filters[key] if low is None else max(low, filters[key])
+            else:
+                high = filters[key] if high is None else min(high, filters[key])
+            ranges[column] = (low, high)
+    if filters.get('panel_colour'):
+        memberships['panel_colour'] = filters['panel_colour']
+    if filters.get('panel_design'):
+        memberships['panel_design'] = filters['panel_design']
+    if filters.get('pal_available') is not None:
+        predicates.append(_per_unit('pcs_pal', filters['pal_available']))
+    if filters.get('ctn_available') is not None:
+        predicates.append(_compare('pcs_ctn', np.greater_equal, 1))
+        predicates.append(_per_unit('pcs_ctn', filters['ctn_available']))
+    if filters.get('length_height_limit'):
+        predicates.append(_compare('largest_area', np.less_equal, 2))
+    if filters.get('urgent_stocks'):
+        two_months_ago = datetime.today() - timedelta(days=60)
+        predicates.append(_compare('min_receipt_at', np.less, np.datetime64(two_months_ago, 'ns')))
+    return ranges, memberships, predicates
+
+
+def narrow_filters(filters, extra):
+    """Return filters restricted further by extra, so that only rows passing
+    both are kept: the higher of each minimum and the lower of each maximum,
+    the later delivery start and earlier delivery end, the colours and
+    designs listed in both, and every flag set in either. Keys that do not
+    filter rows are taken from extra.
+
+    Raises ValueError when the colours or designs have none in common.
+    """
+    result = {**filters, **extra}
+    bounds = {key: bound for key, (_, bound) in range_filters.items()}
+    bounds.update(pal_available='min', ctn_available='min')
+    for key, bound in bounds.items():
+        values = [f[key] for f in (filters, extra) if f.get(key) is not None]
+        if values:
+            result[key] = max(values) if bound == 'min' else min(values)
+    for key, pick in (('delivery_month_start', max), ('delivery_month_end', min)):
+        values = [f[key] for f in (filters, extra) if f.get(key)]
+        if values:
+            result[key] = pick(values, key=lambda value: np.datetime64(value, 'M'))
+    for key in ('panel_colour', 'panel_design'):
+        if filters.get(key) and extra.get(key):
+            result[key] = [value for value in filters[key] if value in extra[key]]
+            if not result[key]:
+                raise ValueError(f'No {key} is allowed by both the configuration and the extra filters')
+        elif key in result:
+            result[key] = filters.get(key) or extra.get(key)
+    for key in ('no_delivery_date', 'length_height_limit', 'urgent_stocks'):
+        if key in result:
+            result[key] = bool(filters.get(key) or extra.get(key))
+    return result
+
+
+def _range_predicates(column, low, high):
+    predicates = []
+    if low is not None:
+        predicates.append(_compare(column, np.greater_equal, low))
+    if high is not None:
+        predicates.append(_compare(column, np.less_equal, high))
+    return predicates
+
+
+def _index_bounds(index, low, high):
+    # Slice of the sorted values lying in [low, high]; NaNs sort last and
+    # never match.
+    values = index[1]
+    start = 0 if low is None else np.searchsorted(values, low, side='left')
+    stop = np.searchsorted(values, np.inf if high is None else high, side='right')
+    return start, stop
+
+
+def _bitmap_union(df, column, bitmaps, values):
+    # Packed bits of the rows whose value is one of values, or None when that
+    # is every row, e.g. when all brands are selected.
+    selected = np.flatnonzero(df[column].cat.categories.isin(values))
+    if len(selected) == len(bitmaps) - 1 and not bitmaps[-1].any():
+        return None
+    if not len(selected):
+        return np.zeros(bitmaps.shape[1], dtype=np.uint8)
+    return np.bitwise_or.reduce(bitmaps[selected], axis=0)
+
+
+def filter_rows(df, compiled, indexes=None):
+    """Return the sorted positions of the rows of df that pass compiled.
+
+    With the indexes of df's snapshot, memberships are combined as OR/AND of
+    packed bitmaps, skipping those every row satisfies, and the narrowest
+    indexed range is looked up with searchsorted; every other filter is then
+    evaluated on those rows only, so the cost follows the number of candidate
+    rows rather than the size of the catalogue. Without indexes every filter
+    runs over all rows, and-ed into a single mask.
+    """
+    ranges, memberships, predicates = compiled
+    predicates = list(predicates)
+    rows = None
+    bits = None
+    if indexes is not None and indexes['rows'] == len(df):
+        for column, values in memberships.items():
+            if column not in indexes['bitmaps']:
+                predicates.insert(0, _isin(column, values))
+                continue
+            selected = _bitmap_union(df, column, indexes['bitmaps'][column], values)
+            if selected is not None:
+                bits = selected if bits is None else np.bitwise_and(bits, selected, out=bits)
+        indexed = {}
+        for column, (low, high) in ranges.items():
+            if column in indexes['ranges']:
+                indexed[column] = _index_bounds(indexes['ranges'][column], low, high)
+        if indexed:
+            column = min(indexed, key=lambda key: indexed[key][1] - indexed[key][0])
+            start, stop = indexed[column]
+            rows = np.sort(indexes['ranges'][column][0][start:stop])
+            ranges = {key: bounds for key, bounds in ranges.items() if key != column}
+    else:
+        predicates = [_isin(column, values) for column, values in memberships.items()] + predicates
+    for column, (low, high) in ranges.items():
+        predicates = _range_predicates(column, low, high) + predicates
+
+    if rows is None:
+        if bits is None:
+            mask = np.ones(len(df), dtype=bool)
+        else:
+            mask = np.unpackbits(bits, count=len(df)).view(bool)
+        for predicate in predicates:
+            np.logical_and(mask, predicate(df, None), out=mask)
+        return np.flatnonzero(mask)
+    if bits is not None:
+        rows = rows[(bits[rows >> 3] >> (7 - (rows & 7))) & 1 == 1]
+    for predicate in predicates:
+        if not len(rows):
+            break
+        rows = rows[predicate(df, rows)]
+    return rows
+
+
+def filter_inventory(df, filters, selected_groups=None, selected_brands=None, indexes=None):
+    """Return the rows of df that pass filters, taken in a single copy.
+
+    indexes are the snapshot indexes returned with df by
+    get_indexed_inventory(); pass them only for the unfiltered frame.
+    """
+    return df.iloc[filter_rows(df, compile_filters(filters, selected_groups, selected_brands), indexes)]
@@ -0,0 +1,47 @@
+import numpy as np
+import pandas as pd
+
+
+def format_number(value):
+    """Format a number the way price lists show it: a space as thousands
+    separator, no decimals for whole numbers and 3 otherwise."""
+    if value.is_integer():
+        return "{:,.0f}".format(value).replace(",", " ")
+    return "{:,.3f}".format(value).replace(",", " ")
+
+
+def format_numbers(column):
+    """Return the cells of a numeric column as display strings, blank for
+    zero and missing values.
+
+    Each distinct value is formatted once and the strings are taken back by
+    position, so the cost follows the number of distinct values rather than
+    the number of rows.
+    """
+    codes, uniques = pd.factorize(column.to_numpy(), use_na_sentinel=True)
+    # str() first keeps float32 values at their shortest decimal form,
+    # e.g. 1.1 instead of 1.100000023841858.
+    formatted = np.array(
+        ['' if value == 0 else format_number(float(str(value))) for value in uniques] + [''],
+        dtype=object,
+    )
+    return pd.Series(formatted[codes], index=column.index, name=column.name)
+
+
+def format_text(column):
+    """Return the cells of a text column as strings, blank for missing
+    values."""
+    values = column.astype(object)
+    return values.where(values.notna(), '').astype(str)
+
+
+def format_table(df):
+    """Return df with every cell as the string shown in PDF and Excel price
+    lists: numeric columns go through format_numbers(), all other columns
+    are kept as text."""
+    def format_column(column):
+        if pd.api.types.is_numeric_dtype(column.dtype) and not pd.api.types.is_bool_dtype(column.dtype):
+            return format_numbers(column)
+        return format_text(column)
+
+    return pd.DataFrame({name: format_column(column) for name, column in df.items()}, index=df.index)
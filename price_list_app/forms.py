@@ -1,6 +1,7 @@
 from django import forms
 from .models import NomenclatureMapping, Brand, Configuration, PanelColour, PanelDesign, BackgroundImage
 from .widgets import MonthYearWidget
+from .formulas import FormulaError, MAX_FORMULA_LENGTH, compile_formula
 from datetime import datetime
 
 
@@ -103,6 +104,17 @@ class SelectionForm(forms.Form):
             self.fields['configurations'].queryset = Configuration.objects.filter(user=user)
         self.fields['selected_columns'].initial = [choice[0] for choice in self.COLUMN_CHOICES]
 
+formula_help = (
+    "A formula replaces the operation and coefficient. price is the product's highest base price; "
+    "available, panel_power, pcs_pal and pcs_ctn are its aggregated values."
+)
+
+def validate_price_formula(value):
+    try:
+        compile_formula(value)
+    except FormulaError as e:
+        raise forms.ValidationError(str(e))
+
 class CoefficientForm(forms.Form):
     name = forms.CharField(max_length=100, required=True, label="Configuration Name")
 
@@ -136,4 +148,11 @@ class CoefficientForm(forms.Form):
                 self.fields[header_key] = forms.CharField(
                     initial=header_default,
                     widget=forms.TextInput(attrs={'class': 'form-control'})
+                )
+                self.fields[f'{group}_formula_{i}'] = forms.CharField(
+                    required=False,
+                    max_length=MAX_FORMULA_LENGTH,
+                    initial=default_config.get(group, {}).get(f'formula_{i}', ''),
+                    validators=[validate_price_formula],
+                    widget=forms.TextInput(attrs={'class': 'form-control', 'placeholder': 'Formula of the highest base price, e.g. (price + 2) * 1.15', 'title': formula_help})
                 )
\ No newline at end of file
@@ -0,0 +1,128 @@
+import ast
+from functools import lru_cache, reduce
+
+import numpy as np
+
+# Names a price formula may use. price is the highest purchase price of the
+# product's lines in the column the warehouse's prices are based on; the
+# others are the product's aggregated values.
+formula_variables = ('price', 'available', 'panel_power', 'pcs_pal', 'pcs_ctn')
+
+formula_functions = ('min', 'max', 'abs', 'round', 'round_to')
+
+MAX_FORMULA_LENGTH = 500
+
+
+class FormulaError(ValueError):
+    pass
+
+
+_binary_operators = {
+    ast.Add: np.add,
+    ast.Sub: np.subtract,
+    ast.Mult: np.multiply,
+    ast.Div: np.divide,
+    ast.Pow: np.power,
+}
+
+_comparisons = {
+    ast.Lt: np.less,
+    ast.LtE: np.less_equal,
+    ast.Gt: np.greater,
+    ast.GtE: np.greater_equal,
+    ast.Eq: np.equal,
+    ast.NotEq: np.not_equal,
+}
+
+
+def _function(name, args):
+    if name in ('min', 'max'):
+        if len(args) < 2:
+            raise FormulaError(f'{name}() needs at least two arguments')
+        ufunc = np.minimum if name == 'min' else np.maximum
+        return lambda v: reduce(ufunc, [arg(v) for arg in args])
+    if name == 'abs':
+        if len(args) != 1:
+            raise FormulaError('abs() takes one argument')
+        return lambda v: np.abs(args[0](v))
+    if name == 'round':
+        if len(args) != 1:
+            raise FormulaError('round() takes one argument; use round_to() for decimals or steps')
+        return lambda v: np.round(args[0](v))
+    if name == 'round_to':
+        # round_to(x, step): nearest multiple of step, e.g. round_to(price, 0.5)
+        if len(args) != 2:
+            raise FormulaError('round_to() takes two arguments')
+        return lambda v: np.round(args[0](v) / args[1](v)) * args[1](v)
+
+
+def _compile_node(node):
+    """Turn an expression node into a function of the variables dict."""
+    if isinstance(node, ast.Constant) and isinstance(node.value, (int, float)) and not isinstance(node.value, bool):
+        value = float(node.value)
+        return lambda v: value
+    if isinstance(node, ast.Name):
+        if node.id not in formula_variables:
+            raise FormulaError(f"Unknown name '{node.id}'; use one of {', '.join(formula_variables)}")
+        name = node.id
+        return lambda v: v[name]
+    if isinstance(node, ast.BinOp) and type(node.op) in _binary_operators:
+        op = _binary_operators[type(node.op)]
+        left, right = _compile_node(node.left), _compile_node(node.right)
+        return lambda v: op(left(v), right(v))
+    if isinstance(node, ast.UnaryOp) and isinstance(node.op, (ast.USub, ast.UAdd, ast.Not)):
+        operand = _compile_node(node.operand)
+        if isinstance(node.op, ast.USub):
+            return lambda v: np.negative(operand(v))
+        if isinstance(node.op, ast.Not):
+            return lambda v: np.logical_not(operand(v))
+        return operand
+    if isinstance(node, ast.Compare):
+        operands = [_compile_node(node.left)] + [_compile_node(c) for c in node.comparators]
+        ops = []
+        for op in node.ops:
+            if type(op) not in _comparisons:
+                raise FormulaError('Unsupported comparison')
+            ops.append(_comparisons[type(op)])
+        pairs = list(zip(ops, operands, operands[1:]))
+        return lambda v: reduce(np.logical_and, [op(a(v), b(v)) for op, a, b in pairs])
+    if isinstance(node, ast.BoolOp):
+        values = [_compile_node(value) for value in node.values]
+        ufunc = np.logical_and if isinstance(node.op, ast.And) else np.logical_or
+        return lambda v: reduce(ufunc, [value(v) for value in values])
+    if isinstance(node, ast.IfExp):
+        test, body, orelse = _compile_node(node.test), _compile_node(node.body), _compile_node(node.orelse)
+        return lambda v: np.where(test(v), body(v), orelse(v))
+    if isinstance(node, ast.Call) and isinstance(node.func, ast.Name) and not node.keywords:
+        if node.func.id not in formula_functions:
+            raise FormulaError(f'Unknown function {node.func.id}()')
+        return _function(node.func.id, [_compile_node(arg) for arg in node.args])
+    raise FormulaError(f'Unsupported expression: {ast.unparse(node)}')
+
+
+@lru_cache(maxsize=1024)
+def compile_formula(formula):
+    """Compile a price formula into a vectorized kernel.
+
+    A formula is an arithmetic expression over formula_variables, e.g.
+    "(price + 2) * 1.15", "price * (1.1 if available >= 100 else 1.2)" or
+    "max(price * 1.05, price + 10)". Supported are + - * / **, comparisons,
+    and/or/not, "a if condition else b", min(), max(), abs(), round() and
+    round_to(x, step). The kernel takes a dict of equally long arrays and
+    returns the price of every row. Kernels are cached by formula text, so
+    each formula is parsed once per process. Raises FormulaError.
+    """
+    if len(formula) > MAX_FORMULA_LENGTH:
+        raise FormulaError(f'Formula is longer than {MAX_FORMULA_LENGTH} characters')
+    try:
+        tree = ast.parse(formula.strip(), mode='eval')
+    except SyntaxError as e:
+        raise FormulaError(f'Invalid formula: {e.msg}')
+    expression = _compile_node(tree.body)
+
+    def kernel(variables):
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            result = expression(variables)
+        return np.broadcast_to(np.asarray(result, dtype=np.float64), np.shape(variables['price'])).copy()
+
+    return kernel
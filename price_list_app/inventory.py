@@ -0,0 +1,815 @@
+import fcntl
+import json
+import os
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+from django.conf import settings
+from django.db import transaction
+from django.db.models import ExpressionWrapper, F, FloatField, Max, Q
+from unidecode import unidecode
+
+from .models import InventoryItem
+from .pricing import base_price_column
+
+csv_file_path = os.path.join(settings.BASE_DIR, 'data', 'data.csv')
+store_dir = os.path.join(settings.BASE_DIR, 'data', 'snapshots')
+
+numeric_columns = [
+    'available', 'available_cz', 'bp_eur', 'bp_eur_cz',
+    'panel_power', 'length', 'width', 'height', 'pcs_pal', 'pcs_ctn'
+]
+
+# Declared dtypes of data.csv. Repeated strings are categoricals, counts are
+# int32 and whole-number measures float32; prices, dimensions and
+# epoch-millisecond receipt dates stay float64, so decimal values compare
+# equal to the filter bounds typed for them. Missing counts and
+# numeric_columns become 0, as they always have.
+inventory_schema = {
+    'product_name': 'object',
+    'status': 'category',
+    'bp_eur': 'float64',
+    'bp_eur_cz': 'float64',
+    'delivery_month': 'datetime64[ns]',
+    'available': 'int32',
+    'available_cz': 'int32',
+    'released_rtd': 'int32',
+    'brand': 'category',
+    'panel_colour': 'category',
+    'panel_design': 'category',
+    'panel_power': 'float32',
+    'inverter_power': 'float32',
+    'nomenclature_group': 'category',
+    'delivery_cw': 'float32',
+    'length': 'float64',
+    'height': 'float64',
+    'width': 'float64',
+    'pcs_ctn': 'int32',
+    'pcs_pal': 'int32',
+    'available_10_only': 'int32',
+    'available_15_only': 'int32',
+    'attribute_2': 'object',
+    'min_receipt_date': 'float64',
+    'max_receipt_date': 'float64',
+}
+
+# Columns derived from the schema columns when a snapshot is built, so that
+# filters compare against stored values instead of recomputing them per
+# request. They are not part of data.csv.
+derived_columns = ['delivery_ym', 'power_available', 'largest_area', 'min_receipt_at']
+
+# Columns stored with a sorted-order index (row positions in ascending value
+# order plus the sorted values), so range filters resolve with searchsorted.
+range_index_columns = ['panel_power', 'length', 'width', 'height', 'available']
+
+# Categorical columns stored with one packed bitmap per category, plus a last
+# one for missing values, so membership filters are OR/AND over bitmaps.
+# 'Group' gets the same kind of index when the shared frame is built.
+bitmap_index_columns = ['nomenclature_group', 'brand', 'panel_colour', 'panel_design']
+
+# Warehouses price lists are made for. Decin sells available_cz, every
+# other warehouse the rest of the availability.
+warehouses = ['Decin', 'Rotterdam']
+
+# Bumped whenever the layout or dtypes of stored snapshots change; versions
+# written with another format are rebuilt from data.csv.
+SNAPSHOT_FORMAT = 7
+
+# The inventory is stored as numbered snapshot versions under data/snapshots/
+# (v1/, v2/, ...) with a CURRENT file naming the published one. Writers take
+# an exclusive flock, build the next version in a temporary directory, fsync
+# it, rename it into place and only then replace CURRENT. Readers never lock:
+# they read CURRENT once per request and memory-map that version, so a request
+# keeps seeing the same inventory even if a new upload is published meanwhile.
+#
+# The parsed frame of the current version is shared by every request of this
+# process. It is rebuilt when CURRENT moves (which also covers uploads handled
+# by other workers), when update_csv_view bumps the generation in this process,
+# or when the nomenclature mapping used for 'Group' changes.
+_lock = threading.Lock()
+_generation = 0
+_cached = (None, None, None, None)
+
+# Versions older than CURRENT - KEEP_VERSIONS are deleted after a publish,
+# unless this process still holds them. Other workers that already mapped an
+# older version keep their pages after the unlink; the retained previous
+# version covers readers that read CURRENT just before the switch.
+KEEP_VERSIONS = 2
+
+
+def invalidate_inventory():
+    global _generation
+    with _lock:
+        _generation += 1
+
+
+@lru_cache(maxsize=65536)
+def _transliterate_value(value):
+    return unidecode(value)
+
+
+def transliterate(df):
+    """Convert all strings in the frame to their ASCII equivalents.
+
+    Each text column is factorized and only its distinct values are
+    transliterated; results are kept in an LRU shared across uploads, so the
+    repeated brand, colour, design and nomenclature values cost one lookup.
+    Returns the converted frame and the number of string cells that did not
+    need a unidecode call.
+    """
+    df = df.copy()
+    string_cells = 0
+    misses_before = _transliterate_value.cache_info().misses
+    for col in df.columns:
+        if df[col].dtype != object:
+            continue
+        codes, uniques = pd.factorize(df[col])
+        is_string = np.array([isinstance(value, str) for value in uniques], dtype=bool)
+        if not is_string.any():
+            continue
+        converted = np.array(
+            [_transliterate_value(value) if text and not value.isascii() else value
+             for value, text in zip(uniques, is_string)],
+            dtype=object,
+        )
+        values = df[col].to_numpy(dtype=object, copy=True)
+        present = codes >= 0
+        values[present] = converted[codes[present]]
+        df[col] = values
+        string_cells += int(is_string[codes[present]].sum())
+    skipped = string_cells - (_transliterate_value.cache_info().misses - misses_before)
+    return df, skipped
+
+
+def _file_signature(path):
+    stat = os.stat(path)
+    return stat.st_mtime_ns, stat.st_size
+
+
+def _parse_month(values):
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    parsed = pd.to_datetime(values, format='%m/%Y', errors='coerce')
+    if parsed.isna().sum() > values.isna().sum():
+        parsed = pd.to_datetime(values, errors='coerce')
+    return parsed
+
+
+def _normalize(df):
+    """Cast df to inventory_schema; columns outside the schema are kept as
+    they are."""
+    for col, dtype in inventory_schema.items():
+        if col not in df.columns:
+            continue
+        values = df[col]
+        if dtype == 'category':
+            if not isinstance(values.dtype, pd.CategoricalDtype):
+                values = values.astype('category')
+        elif dtype == 'datetime64[ns]':
+            values = _parse_month(values)
+        elif dtype != 'object':
+            if not pd.api.types.is_numeric_dtype(values):
+                values = pd.to_numeric(values, errors='coerce')
+            if dtype.startswith('int') or col in numeric_columns:
+                values = values.fillna(0)
+            values = values.astype(dtype)
+        df[col] = values
+    return df
+
+
+def _read_csv():
+    # A single read_csv pass with the declared dtypes. A stray non-numeric
+    # value makes pandas reject the typed parse; fall back to coercion then.
+    csv_dtypes = {
+        col: 'category' if dtype == 'category' else 'float64' if dtype != 'object' else 'object'
+        for col, dtype in inventory_schema.items() if dtype != 'datetime64[ns]'
+    }
+    try:
+        df = pd.read_csv(csv_file_path, dtype=csv_dtypes, parse_dates=['delivery_month'], date_format='%m/%Y')
+    except ValueError:
+        df = pd.read_csv(csv_file_path)
+    return _normalize(df)
+
+
+def _add_derived(df):
+    """Add derived_columns to a frame cast to inventory_schema."""
+    df['delivery_ym'] = df['delivery_month'].dt.strftime('%Y-%m').astype('category')
+    df['power_available'] = df['available'].astype('float64') * df['panel_power'].astype('float64') / 1000
+    # Area in m2 of the two largest of length, height and width.
+    dims = np.sort(df[['length', 'height', 'width']].to_numpy(dtype='float64'), axis=1)
+    df['largest_area'] = dims[:, 2] / 1000 * dims[:, 1] / 1000
+    df['min_receipt_at'] = pd.to_datetime(df['min_receipt_date'], unit='ms')
+    return df
+
+
+def warehouse_available(df, warehouse):
+    """Return the availability of the rows of df in warehouse."""
+    if warehouse == 'Decin':
+        return df['available_cz']
+    return df['available'] - df['available_cz']
+
+
+def product_aggregations(warehouse):
+    """Named aggregations turning the receipt lines of a product into one
+    price list row for warehouse."""
+    base_price = base_price_column(warehouse)
+    return {
+        'available': ('available', 'sum'),
+        'bp_eur': ('bp_eur', 'max'),
+        'base_price_min': (base_price, 'min'),
+        'base_price_max': (base_price, 'max'),
+        'delivery_month': ('delivery_month', 'first'),
+        'delivery_cw': ('delivery_cw', 'first'),
+        'panel_power': ('panel_power', 'first'),
+        'panel_colour': ('panel_colour', 'first'),
+        'panel_design': ('panel_design', 'first'),
+        'length': ('length', 'first'),
+        'width': ('width', 'first'),
+        'height': ('height', 'first'),
+        'pcs_pal': ('pcs_pal', 'first'),
+        'pcs_ctn': ('pcs_ctn', 'first'),
+    }
+
+
+def aggregate_products(df, warehouse, keys=('Group', 'brand', 'product_name'), dropna=True):
+    """Aggregate the lines of df that are in stock in warehouse per keys,
+    with availability summed, base prices ranged and other attributes taken
+    from the first line. df's delivery_month must already be the displayed
+    month."""
+    df = df.assign(available=warehouse_available(df, warehouse))
+    df = df[df['available'] > 0]
+    return df.groupby(list(keys), as_index=False, observed=True, dropna=dropna).agg(**product_aggregations(warehouse))
+
+
+def _product_table(df, warehouse):
+    # Products aggregated per nomenclature group, so 'Group' can be derived
+    # from the nomenclature mapping when the table is read. Products whose
+    # lines span nomenclature groups would need their 'first' attributes
+    # merged across groups, so those inventories are aggregated per request.
+    lines = df.assign(delivery_month=df['delivery_ym'])
+    lines = lines[lines['brand'].notna() & lines['product_name'].notna()]
+    table = aggregate_products(lines, warehouse, ('nomenclature_group', 'brand', 'product_name'), dropna=False)
+    if table.duplicated(['brand', 'product_name']).any():
+        return None
+    return table
+
+
+def _fsync_dir(path):
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+
+
+def _save_array(path, array):
+    with open(path, 'wb') as f:
+        np.save(f, array)
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def atomic_write_csv(df, path):
+    """Write df as latin-1 CSV so that readers see either the old or the new
+    file, never a partially written one."""
+    directory = os.path.dirname(path)
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix='.tmp-', suffix='.csv')
+    try:
+        with os.fdopen(fd, 'w', encoding='latin-1', newline='') as f:
+            df.to_csv(f, index=False)
+            f.flush()
+            os.fsync(f.fileno())
+        os.chmod(tmp_path, 0o644)
+        os.replace(tmp_path, path)
+    except BaseException:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    _fsync_dir(directory)
+
+
+@contextmanager
+def _writer_lock(blocking=True):
+    os.makedirs(store_dir, exist_ok=True)
+    with open(os.path.join(store_dir, '.lock'), 'w') as f:
+        try:
+            fcntl.flock(f, fcntl.LOCK_EX if blocking else fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            yield False
+            return
+        try:
+            yield True
+        finally:
+            fcntl.flock(f, fcntl.LOCK_UN)
+
+
+def _version_dir(version):
+    return os.path.join(store_dir, f'v{version}')
+
+
+def inventory_version():
+    """Return the published inventory version, or None before the first one."""
+    try:
+        with open(os.path.join(store_dir, 'CURRENT')) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+
+def _stored_versions():
+    versions = []
+    for name in os.listdir(store_dir):
+        if name.startswith('v') and name[1:].isdigit():
+            versions.append(int(name[1:]))
+    return versions
+
+
+def _bitmaps(codes, count):
+    # Row k holds the packed bits of the rows whose code is k; the last row
+    # those of the missing values (code -1).
+    codes = np.where(codes < 0, count, codes)
+    return np.stack([np.packbits(codes == k) for k in range(count + 1)])
+
+
+def _write_columns(df, directory, prefix):
+    columns = []
+    for i, col in enumerate(df.columns):
+        values = df[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = [str(c) for c in values.cat.categories]
+            categories = np.array(categories, dtype=f'<U{max([1] + [len(c) for c in categories])}')
+            _save_array(os.path.join(directory, f'{prefix}{i}.codes.npy'), values.cat.codes.to_numpy().astype(np.int32))
+            _save_array(os.path.join(directory, f'{prefix}{i}.values.npy'), categories)
+            columns.append({'name': col, 'kind': 'category'})
+        elif pd.api.types.is_datetime64_any_dtype(values):
+            _save_array(os.path.join(directory, f'{prefix}{i}.npy'), values.to_numpy(dtype='datetime64[ns]'))
+            columns.append({'name': col, 'kind': 'numeric'})
+        elif pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+            _save_array(os.path.join(directory, f'{prefix}{i}.npy'), values.to_numpy())
+            columns.append({'name': col, 'kind': 'numeric'})
+        else:
+            codes, uniques = pd.factorize(values)
+            uniques = np.array([str(u) for u in uniques], dtype=f'<U{max([1] + [len(str(u)) for u in uniques])}')
+            _save_array(os.path.join(directory, f'{prefix}{i}.codes.npy'), codes.astype(np.int32))
+            _save_array(os.path.join(directory, f'{prefix}{i}.values.npy'), uniques)
+            columns.append({'name': col, 'kind': 'text'})
+    return columns
+
+
+def _write_snapshot(df, directory, payload_hash):
+    """Write df as a columnar snapshot into directory.
+
+    Numeric columns are stored as plain .npy arrays and text columns as int32
+    codes plus a fixed-width table of their distinct values, so readers can
+    memory-map every file and worker processes share the same pages.
+    payload_hash identifies the upload the snapshot was built from, so an
+    identical upload can be skipped. The product table of each warehouse
+    (see _product_table) is stored the same way.
+    """
+    columns = _write_columns(df, directory, 'c')
+    range_indexes = [col for col in range_index_columns if col in df.columns]
+    for col in range_indexes:
+        values = df[col].to_numpy()
+        order = np.argsort(values, kind='stable').astype(np.int32)
+        _save_array(os.path.join(directory, f'{col}.order.npy'), order)
+        _save_array(os.path.join(directory, f'{col}.sorted.npy'), values[order])
+    bitmap_indexes = [
+        col for col in bitmap_index_columns
+        if col in df.columns and isinstance(df[col].dtype, pd.CategoricalDtype)
+    ]
+    for col in bitmap_indexes:
+        values = df[col]
+        _save_array(os.path.join(directory, f'{col}.bitmaps.npy'),
+                    _bitmaps(values.cat.codes.to_numpy(), len(values.cat.categories)))
+    products = {}
+    for warehouse in warehouses:
+        table = _product_table(df, warehouse)
+        if table is not None:
+            products[warehouse] = {
+                'rows': len(table),
+                'columns': _write_columns(table, directory, f'{warehouse}.c'),
+            }
+    meta = {
+        'format': SNAPSHOT_FORMAT,
+        'rows': len(df),
+        'columns': columns,
+        'range_indexes': range_indexes,
+        'bitmap_indexes': bitmap_indexes,
+        'products': products,
+        'source': list(_file_signature(csv_file_path)),
+        'payload_hash': payload_hash,
+    }
+    with open(os.path.join(directory, 'meta.json'), 'w') as f:
+        json.dump(meta, f)
+        f.flush()
+        os.fsync(f.fileno())
+    _fsync_dir(directory)
+
+
+def _for_export(df):
+    # data.csv keeps the MM/YYYY months the ERP sends.
+    df = df.drop(columns=derived_columns, errors='ignore')
+    if pd.api.types.is_datetime64_any_dtype(df.get('delivery_month')):
+        df['delivery_month'] = df['delivery_month'].dt.strftime('%m/%Y')
+    return df
+
+
+def _publish(df, payload_hash, export=True):
+    # Must be called with the writer lock held.
+    if export:
+        atomic_write_csv(_for_export(df), csv_file_path)
+    df = _add_derived(_normalize(df.copy()))
+    version = max(_stored_versions() + [inventory_version() or 0]) + 1
+    tmp_dir = tempfile.mkdtemp(dir=store_dir, prefix='.tmp-')
+    os.chmod(tmp_dir, 0o755)
+    try:
+        _write_snapshot(df, tmp_dir, payload_hash)
+        os.rename(tmp_dir, _version_dir(version))
+    except BaseException:
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+        raise
+    _fsync_dir(store_dir)
+
+    fd, tmp_current = tempfile.mkstemp(dir=store_dir, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(f'{version}\n')
+        f.flush()
+        os.fsync(f.fileno())
+    os.chmod(tmp_current, 0o644)
+    os.replace(tmp_current, os.path.join(store_dir, 'CURRENT'))
+    _fsync_dir(store_dir)
+    _collect_garbage(version)
+    if getattr(settings, 'INVENTORY_DATABASE', False):
+        sync_inventory_items(df, version)
+    return version
+
+
+def publish_inventory(df, payload_hash=None):
+    """Store df as the new inventory: data.csv is rewritten atomically as an
+    export and a new snapshot version is published. Returns the version."""
+    with _writer_lock():
+        return _publish(df, payload_hash)
+
+
+def _collect_garbage(current):
+    in_use = {_cached[0][1]} if _cached[0] else set()
+    for version in _stored_versions():
+        if version <= current - KEEP_VERSIONS and version not in in_use:
+            shutil.rmtree(_version_dir(version), ignore_errors=True)
+
+
+def _read_meta(version):
+    try:
+        with open(os.path.join(_version_dir(version), 'meta.json')) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def last_payload_hash():
+    version = inventory_version()
+    meta = _read_meta(version) if version else None
+    return meta.get('payload_hash') if meta else None
+
+
+def _read_columns(directory, columns, prefix):
+    data = {}
+    for i, column in enumerate(columns):
+        if column['kind'] == 'numeric':
+            data[column['name']] = np.load(os.path.join(directory, f'{prefix}{i}.npy'), mmap_mode='r')
+        else:
+            codes = np.load(os.path.join(directory, f'{prefix}{i}.codes.npy'), mmap_mode='r')
+            uniques = np.load(os.path.join(directory, f'{prefix}{i}.values.npy')).astype(object)
+            values = pd.Categorical.from_codes(codes, categories=uniques)
+            data[column['name']] = values if column['kind'] == 'category' else values.astype(object)
+    return pd.DataFrame(data, copy=False)
+
+
+def _read_snapshot(version, meta):
+    """Return the snapshot as a frame over memory-mapped arrays."""
+    return _read_columns(_version_dir(version), meta['columns'], 'c')
+
+
+def _read_products(version, meta):
+    """Return {warehouse: product table} of the warehouses whose table was
+    stored with the snapshot."""
+    directory = _version_dir(version)
+    return {
+        warehouse: _read_columns(directory, table['columns'], f'{warehouse}.c')
+        for warehouse, table in meta.get('products', {}).items()
+    }
+
+
+def _read_indexes(version, meta):
+    """Return the memory-mapped indexes of a snapshot as {'rows': n,
+    'ranges': {column: (order, sorted_values)}, 'bitmaps': {column: bitmaps}},
+    the bitmaps being ordered like the column's categories."""
+    directory = _version_dir(version)
+    ranges = {}
+    for col in meta.get('range_indexes', []):
+        ranges[col] = (
+            np.load(os.path.join(directory, f'{col}.order.npy'), mmap_mode='r'),
+            np.load(os.path.join(directory, f'{col}.sorted.npy'), mmap_mode='r'),
+        )
+    bitmaps = {
+        col: np.load(os.path.join(directory, f'{col}.bitmaps.npy'), mmap_mode='r')
+        for col in meta.get('bitmap_indexes', [])
+    }
+    return {'rows': meta['rows'], 'ranges': ranges, 'bitmaps': bitmaps}
+
+
+def _is_current(meta):
+    return (
+        meta is not None
+        and meta.get('format') == SNAPSHOT_FORMAT
+        and meta.get('source') == list(_file_signature(csv_file_path))
+    )
+
+
+def _import_csv():
+    """Publish data.csv as a new version when no version matches it, e.g. on
+    a fresh checkout or after the file was replaced by hand. Does not wait for
+    a writer that is already publishing."""
+    with _writer_lock(blocking=False) as locked:
+        if locked:
+            version = inventory_version()
+            meta = _read_meta(version) if version else None
+            if not _is_current(meta):
+                _publish(_read_csv(), None, export=False)
+
+
+def _load_version(with_indexes=False):
+    """Pin the current version and return it with its rows, and with its
+    indexes and product tables (None when read from data.csv) if
+    with_indexes is set."""
+    for attempt in range(3):
+        version = inventory_version()
+        meta = _read_meta(version) if version else None
+        if not _is_current(meta):
+            _import_csv()
+            version = inventory_version()
+            meta = _read_meta(version) if version else None
+            if meta is None:
+                continue
+        try:
+            if with_indexes:
+                return version, _read_snapshot(version, meta), _read_indexes(version, meta), _read_products(version, meta)
+            return version, _read_snapshot(version, meta)
+        except FileNotFoundError:
+            # Collected between reading CURRENT and opening its files.
+            continue
+    df = _add_derived(_read_csv())
+    return (None, df, None, None) if with_indexes else (None, df)
+
+
+def apply_delta(upserts, deletes, payload_hash=None, key='attribute_2'):
+    """Apply upserted rows and deleted keys to the current inventory and
+    publish the result as a new version.
+
+    Updated rows keep their position, so 'first' aggregates over receipt lines
+    are unaffected; new rows are appended at the end. upserts are cast to
+    inventory_schema first, so they merge with the stored columns.
+    """
+    with _writer_lock():
+        _, df = _load_version()
+        df = _merge_delta(df.drop(columns=derived_columns), _normalize(upserts), deletes, key)
+        return _publish(df, payload_hash)
+
+
+def _merge_delta(df, upserts, deletes, key):
+    if len(upserts):
+        # The last row of a key listed twice wins; an updated key takes the
+        # place of its first existing row.
+        upserts = upserts.drop_duplicates(key, keep='last').reindex(columns=df.columns)
+        # Columns the upserts leave empty take the stored dtype, so the
+        # merged dtype does not depend on them.
+        upserts = upserts.astype({
+            col: df[col].dtype for col in df.columns
+            if upserts[col].isna().all() and not pd.api.types.is_integer_dtype(df[col])
+        })
+        first = pd.Series(np.arange(len(df)), index=df[key].to_numpy())
+        first = first[~first.index.duplicated()]
+        kept = ~df[key].isin(upserts[key]).to_numpy()
+        order = np.concatenate([np.flatnonzero(kept), upserts[key].map(first).to_numpy(dtype=float)])
+        new_rows = np.isnan(order)
+        order[new_rows] = len(df) + np.arange(new_rows.sum())
+        df = pd.concat([df[kept], upserts], ignore_index=True)
+        df = df.iloc[np.argsort(order, kind='stable')].reset_index(drop=True)
+    if deletes:
+        df = df[~df[key].isin(deletes)].reset_index(drop=True)
+    return df
+
+
+def _add_group(df, nomenclature_mapping):
+    """Add the 'Group' column; returns the group of each nomenclature_group
+    category, with the group of missing values last."""
+    # Map each distinct nomenclature_group once instead of every row.
+    nomenclature_group = df['nomenclature_group'].astype('category')
+    prefixes = pd.Series(nomenclature_group.cat.categories.astype(str)).str[:3]
+    lookup = np.append(prefixes.map(nomenclature_mapping).fillna('Unknown').to_numpy(dtype=object), 'Unknown')
+    df['Group'] = pd.Categorical(lookup[nomenclature_group.cat.codes.to_numpy()])
+    return lookup
+
+
+def _add_group_bitmaps(indexes, df, lookup):
+    # A group's bitmap is the union of those of its nomenclature groups.
+    nomenclature_bitmaps = indexes['bitmaps'].get('nomenclature_group')
+    if nomenclature_bitmaps is None:
+        return
+    groups = df['Group'].cat.categories
+    bitmaps = np.zeros((len(groups) + 1, nomenclature_bitmaps.shape[1]), dtype=np.uint8)
+    for i, group in enumerate(groups):
+        np.bitwise_or.reduce(nomenclature_bitmaps[lookup == group], axis=0, out=bitmaps[i])
+    indexes['bitmaps']['Group'] = bitmaps
+
+
+def get_indexed_inventory(nomenclature_mapping):
+    """Return a shallow copy of the parsed inventory frame together with the
+    indexes of its snapshot (see _read_indexes), or None for indexes when the
+    frame was read from data.csv.
+
+    Callers may add or replace columns, but must not modify values in place:
+    the underlying arrays are shared with other requests and may be read-only
+    memory maps. The indexes describe the rows of the returned frame and stop
+    applying once it is filtered or reordered.
+    """
+    _, frame, indexes, _ = _current(nomenclature_mapping)
+    return frame.copy(deep=False), indexes
+
+
+def get_inventory_snapshot(nomenclature_mapping):
+    """Return (version, frame, indexes, products) of a single published
+    version, read together so a request never mixes versions.
+
+    frame and indexes are as returned by get_indexed_inventory(); pass the
+    whole tuple to get_products() to aggregate the same version.
+    """
+    key, frame, indexes, products = _current(nomenclature_mapping)
+    return key[1], frame.copy(deep=False), indexes, products
+
+
+def _current(nomenclature_mapping):
+    # The cached (key, frame, indexes, products) of the current version,
+    # reloaded first when it is stale.
+    global _cached
+    mapping_key = tuple(sorted(nomenclature_mapping.items()))
+
+    def current_key():
+        return _generation, inventory_version(), _file_signature(csv_file_path), mapping_key
+
+    cached = _cached
+    if cached[0] != current_key():
+        with _lock:
+            key = current_key()
+            cached = _cached
+            if cached[0] != key:
+                version, frame, indexes, products = _load_version(with_indexes=True)
+                lookup = _add_group(frame, nomenclature_mapping)
+                if indexes is not None:
+                    _add_group_bitmaps(indexes, frame, lookup)
+                for table in (products or {}).values():
+                    _add_group(table, nomenclature_mapping)
+                cached = _cached = ((key[0], version) + key[2:], frame, indexes, products)
+    return cached
+
+
+def get_inventory(nomenclature_mapping):
+    """Return a shallow copy of the parsed inventory frame; see
+    get_indexed_inventory()."""
+    return get_indexed_inventory(nomenclature_mapping)[0]
+
+
+def get_products(nomenclature_mapping, warehouse, snapshot=None):
+    """Return the inventory aggregated per product for warehouse, as
+    aggregate_products() would over every line, ordered by 'Group', 'brand'
+    and 'product_name'.
+
+    The table materialized with the snapshot is used when there is one, so
+    only its rows are touched; otherwise the lines are aggregated. snapshot
+    is a get_inventory_snapshot() result and defaults to the current
+    version. The same rules as for get_indexed_inventory() apply to the
+    returned frame.
+    """
+    warehouse = 'Decin' if warehouse == 'Decin' else 'Rotterdam'
+    _, frame, _, products = snapshot or _current(nomenclature_mapping)
+    table = (products or {}).get(warehouse)
+    if table is None:
+        return aggregate_products(frame.assign(delivery_month=frame['delivery_ym']), warehouse)
+    # Every product is a single row of the table, so ordering it is all the
+    # regrouping per 'Group' needs.
+    table = table[['Group'] + [col for col in table.columns if col not in ('Group', 'nomenclature_group')]]
+    return table.sort_values(['Group', 'brand', 'product_name'], kind='stable', ignore_index=True)
+
+
+_synced_version = None
+
+inventory_item_fields = [
+    field.name for field in InventoryItem._meta.get_fields()
+    if field.name not in ('id', 'position', 'inventory_version')
+]
+
+
+def sync_inventory_items(df, version):
+    """Replace the InventoryItem rows with the published rows of version,
+    one per line in store order, so repeated attribute_2 values are kept."""
+    df = df.reindex(columns=inventory_item_fields)
+    df['delivery_month'] = pd.to_datetime(df['delivery_month'], errors='coerce').dt.date
+    df = df.astype(object).where(df.notna(), None)
+    items = [
+        InventoryItem(position=position, inventory_version=version, **row)
+        for position, row in enumerate(df.to_dict('records'))
+    ]
+    with transaction.atomic():
+        InventoryItem.objects.bulk_create(items, batch_size=500)
+        InventoryItem.objects.filter(inventory_version__lt=version).delete()
+
+
+def _filters_to_q(selected_groups, selected_brands, filters, nomenclature_mapping):
+    prefixes = [key for key, value in nomenclature_mapping.items() if value in selected_groups]
+    groups_q = Q()
+    for prefix in prefixes:
+        groups_q |= Q(nomenclature_group__startswith=prefix)
+    q = (groups_q if prefixes else Q(pk__in=[])) & Q(brand__in=selected_brands)
+
+    if filters.get('no_delivery_date'):
+        q &= Q(delivery_month__isnull=True)
+    else:
+        if filters.get('delivery_month_start'):
+            q &= Q(delivery_month__gte=datetime.strptime(filters['delivery_month_start'], '%Y-%m').date())
+        if filters.get('delivery_month_end'):
+            end = datetime.strptime(filters['delivery_month_end'], '%Y-%m').date()
+            q &= Q(delivery_month__lt=(end + timedelta(days=31)).replace(day=1))
+    for field, lookup, key in [
+        ('panel_power', 'gte', 'panel_power_min'), ('panel_power', 'lte', 'panel_power_max'),
+        ('length', 'gte', 'length_min'), ('length', 'lte', 'length_max'),
+        ('height', 'gte', 'height_min'), ('height', 'lte', 'height_max'),
+        ('width', 'gte', 'width_min'), ('width', 'lte', 'width_max'),
+        ('available', 'gte', 'available'),
+    ]:
+        if filters.get(key) is not None:
+            q &= Q(**{f'{field}__{lookup}': filters[key]})
+    if filters.get('panel_colour'):
+        q &= Q(panel_colour__in=filters['panel_colour'])
+    if filters.get('panel_design'):
+        q &= Q(panel_design__in=filters['panel_design'])
+    if filters.get('power_available') is not None:
+        q &= Q(power_available__gte=filters['power_available'])
+    if filters.get('pal_available') is not None:
+        # available / pcs_pal >= n, without dividing by an empty pallet size
+        q &= Q(pcs_pal__gt=0, available__gte=F('pcs_pal') * filters['pal_available']) | Q(pcs_pal=0, available__gt=0)
+    if filters.get('ctn_available') is not None:
+        q &= Q(pcs_ctn__gte=1, available__gte=F('pcs_ctn') * filters['ctn_available'])
+    if filters.get('urgent_stocks'):
+        # min_receipt_date is epoch milliseconds, compared as naive UTC like pandas does
+        two_months_ago = datetime.today() - timedelta(days=60)
+        q &= Q(min_receipt_date__lt=(two_months_ago - datetime(1970, 1, 1)).total_seconds() * 1000)
+    return q
+
+
+def _items_version():
+    return InventoryItem.objects.aggregate(latest=Max('inventory_version'))['latest']
+
+
+def _ensure_items_synced():
+    # The table may lag behind the store when INVENTORY_DATABASE was enabled
+    # after the last upload, or data.csv was replaced by hand. The snapshot
+    # is only loaded when it does.
+    global _synced_version
+    version = inventory_version()
+    if version is not None and _is_current(_read_meta(version)):
+        if version == _synced_version:
+            return
+        latest = _items_version()
+        if latest is not None and latest >= version:
+            _synced_version = version
+            return
+    # Also publishes data.csv first if it was replaced by hand
+    version, df = _load_version()
+    if version is None:
+        return
+    with _writer_lock():
+        latest = _items_version()
+        if latest is None or latest < version:
+            sync_inventory_items(df, version)
+    _synced_version = version
+
+
+def query_inventory(selected_groups, selected_brands, filters, nomenclature_mapping):
+    """Load only the InventoryItem rows matching a configuration, as a frame
+    shaped like get_inventory()."""
+    _ensure_items_synced()
+    queryset = InventoryItem.objects.alias(
+        power_available=ExpressionWrapper(F('available') * F('panel_power') / 1000.0, output_field=FloatField()),
+    ).filter(
+        _filters_to_q(selected_groups, selected_brands, filters, nomenclature_mapping)
+    ).order_by('position').values_list(*inventory_item_fields)
+    df = pd.DataFrame.from_records(list(queryset), columns=inventory_item_fields)
+    _add_derived(_normalize(df))
+    _add_group(df, nomenclature_mapping)
+    return df
@@ -0,0 +1,47 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from price_list_app.filters import filter_inventory
+from price_list_app.inventory import get_indexed_inventory
+from price_list_app.models import Configuration
+from price_list_app.reference import reference_data
+
+
+class Command(BaseCommand):
+    help = 'Applies the filters of a configuration, or a filters JSON, to the current inventory'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', type=int, help='Id of the Configuration whose groups, brands and filters to apply')
+        parser.add_argument('--filters', help='Filters as a JSON object, used instead of or on top of --config')
+        parser.add_argument('--output', help='Write the matching rows to this CSV file instead of printing a summary')
+
+    def handle(self, *args, **options):
+        selected_groups = selected_brands = None
+        filters = {}
+        if options['config']:
+            try:
+                config = Configuration.objects.get(id=options['config'])
+            except Configuration.DoesNotExist:
+                raise CommandError(f"Configuration {options['config']} does not exist")
+            selected_groups = json.loads(config.selected_groups)
+            if config.select_all_brands:
+                selected_brands = reference_data()['brands']
+            else:
+                selected_brands = json.loads(config.selected_brands)
+            filters = json.loads(config.filters)
+        if options['filters']:
+            try:
+                filters = {**filters, **json.loads(options['filters'])}
+            except ValueError as e:
+                raise CommandError(f'Invalid filters JSON: {e}')
+
+        df, indexes = get_indexed_inventory(reference_data()['nomenclature_mapping'])
+        result = filter_inventory(df, filters, selected_groups, selected_brands, indexes)
+        if options['output']:
+            result.to_csv(options['output'], index=False)
+            self.stdout.write(self.style.SUCCESS(f"Wrote {len(result)} of {len(df)} rows to {options['output']}"))
+        else:
+            self.stdout.write(f'{len(result)} of {len(df)} rows match')
+            for name, count in result.groupby('Group', observed=True).size().items():
+                self.stdout.write(f'  {name}: {count}')
@@ -0,0 +1,54 @@
+import json
+
+from django.core.management.base import BaseCommand, CommandError
+
+from price_list_app.filters import narrow_filters
+from price_list_app.models import Configuration
+from price_list_app.pricing import simulate_prices, simulation_grid
+from price_list_app.products import get_configuration_products
+
+
+class Command(BaseCommand):
+    help = 'Compares revenue, margin and price spread per group of a configuration over a grid of coefficients'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--config', type=int, required=True, help='Id of the Configuration whose products to price')
+        parser.add_argument('--coefficients', type=float, nargs='+', required=True, help='Coefficients to try, e.g. 1.1 1.15 1.2')
+        parser.add_argument('--operations', nargs='+', default=['*'], choices=['*', '+'], help='Operations to try each coefficient with')
+        parser.add_argument('--filters', help='Filters as a JSON object, narrowing the configuration\'s')
+        parser.add_argument('--brands', action='store_true', help='Report per group and brand instead of per group')
+
+    def handle(self, *args, **options):
+        try:
+            config = Configuration.objects.get(id=options['config'])
+        except Configuration.DoesNotExist:
+            raise CommandError(f"Configuration {options['config']} does not exist")
+        filters = None
+        if options['filters']:
+            try:
+                extra_filters = json.loads(options['filters'])
+            except ValueError as e:
+                raise CommandError(f'Invalid filters JSON: {e}')
+            if not isinstance(extra_filters, dict):
+                raise CommandError('Filters must be a JSON object')
+            try:
+                filters = narrow_filters(json.loads(config.filters), extra_filters)
+            except (TypeError, ValueError) as e:
+                raise CommandError(str(e))
+
+        keys = ['Group', 'brand'] if options['brands'] else ['Group']
+        try:
+            scenarios = simulation_grid(options['operations'], options['coefficients'])
+            key_frame, stats = simulate_prices(get_configuration_products(config, filters, copy=False), scenarios, keys)
+        except ValueError as e:
+            raise CommandError(str(e))
+        for i, key in enumerate(key_frame.to_dict('records')):
+            name = ' / '.join(str(key[column]) for column in keys)
+            self.stdout.write(f"{name} ({key['products']} products)")
+            for s, (operation, coefficient) in enumerate(scenarios):
+                self.stdout.write(
+                    f"  {operation} {coefficient:g}: revenue {stats['revenue'][s, i]:.2f}, "
+                    f"margin {stats['total_margin'][s, i]:.2f}, "
+                    f"price {stats['min_price'][s, i]:g}..{stats['max_price'][s, i]:g} "
+                    f"(mean {stats['mean_price'][s, i]:.2f})"
+                )
@@ -0,0 +1,49 @@
+# Generated by Django 5.0.6 on 2026-10-18 13:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('price_list_app', '0013_remove_backgroundimage_image_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='InventoryItem',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('attribute_2', models.CharField(max_length=50, unique=True)),
+                ('position', models.IntegerField()),
+                ('inventory_version', models.IntegerField()),
+                ('product_name', models.CharField(max_length=255)),
+                ('status', models.CharField(blank=True, max_length=50, null=True)),
+                ('bp_eur', models.FloatField(default=0)),
+                ('bp_eur_cz', models.FloatField(default=0)),
+                ('delivery_month', models.DateField(blank=True, db_index=True, null=True)),
+                ('available', models.IntegerField(default=0)),
+                ('available_cz', models.IntegerField(default=0)),
+                ('released_rtd', models.IntegerField(default=0)),
+                ('brand', models.CharField(db_index=True, max_length=50)),
+                ('panel_colour', models.CharField(blank=True, max_length=50, null=True)),
+                ('panel_design', models.CharField(blank=True, max_length=50, null=True)),
+                ('panel_power', models.FloatField(db_index=True, default=0)),
+                ('inverter_power', models.FloatField(default=0)),
+                ('nomenclature_group', models.CharField(db_index=True, max_length=20)),
+                ('delivery_cw', models.FloatField(blank=True, null=True)),
+                ('length', models.FloatField(db_index=True, default=0)),
+                ('height', models.FloatField(db_index=True, default=0)),
+                ('width', models.FloatField(db_index=True, default=0)),
+                ('pcs_ctn', models.IntegerField(default=0)),
+                ('pcs_pal', models.IntegerField(default=0)),
+                ('available_10_only', models.IntegerField(default=0)),
+                ('available_15_only', models.IntegerField(default=0)),
+                ('min_receipt_date', models.FloatField(blank=True, null=True)),
+                ('max_receipt_date', models.FloatField(blank=True, null=True)),
+            ],
+            options={
+                'ordering': ['position'],
+            },
+        ),
+    ]
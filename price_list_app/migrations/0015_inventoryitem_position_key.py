@@ -0,0 +1,22 @@
+# Generated by Django 5.0.6 on 2026-10-18 15:31
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('price_list_app', '0014_inventoryitem'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='inventoryitem',
+            name='attribute_2',
+            field=models.CharField(db_index=True, max_length=50),
+        ),
+        migrations.AddConstraint(
+            model_name='inventoryitem',
+            constraint=models.UniqueConstraint(fields=('inventory_version', 'position'), name='unique_inventory_item_position'),
+        ),
+    ]
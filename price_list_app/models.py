@@ -100,3 +100,44 @@ class Promotion(models.Model):
 
     def __str__(self):
         return f"{self.product_name} - {self.selling_price}"
+
+class InventoryItem(models.Model):
+    # One receipt line of data.csv, kept in sync with the published inventory
+    # when settings.INVENTORY_DATABASE is enabled. Rows are keyed by their
+    # position in a version, as attribute_2 may repeat in data.csv.
+    attribute_2 = models.CharField(max_length=50, db_index=True)
+    position = models.IntegerField()
+    inventory_version = models.IntegerField()
+    product_name = models.CharField(max_length=255)
+    status = models.CharField(max_length=50, null=True, blank=True)
+    bp_eur = models.FloatField(default=0)
+    bp_eur_cz = models.FloatField(default=0)
+    delivery_month = models.DateField(null=True, blank=True, db_index=True)
+    available = models.IntegerField(default=0)
+    available_cz = models.IntegerField(default=0)
+    released_rtd = models.IntegerField(default=0)
+    brand = models.CharField(max_length=50, db_index=True)
+    panel_colour = models.CharField(max_length=50, null=True, blank=True)
+    panel_design = models.CharField(max_length=50, null=True, blank=True)
+    panel_power = models.FloatField(default=0, db_index=True)
+    inverter_power = models.FloatField(default=0)
+    nomenclature_group = models.CharField(max_length=20, db_index=True)
+    delivery_cw = models.FloatField(null=True, blank=True)
+    length = models.FloatField(default=0, db_index=True)
+    height = models.FloatField(default=0, db_index=True)
+    width = models.FloatField(default=0, db_index=True)
+    pcs_ctn = models.IntegerField(default=0)
+    pcs_pal = models.IntegerField(default=0)
+    available_10_only = models.IntegerField(default=0)
+    available_15_only = models.IntegerField(default=0)
+    min_receipt_date = models.FloatField(null=True, blank=True)
+    max_receipt_date = models.FloatField(null=True, blank=True)
+
+    class Meta:
+        ordering = ['position']
+        constraints = [
+            models.UniqueConstraint(fields=['inventory_version', 'position'], name='unique_inventory_item_position'),
+        ]
+
+    def __str__(self):
+        return f"{self.product_name} ({self.attribute_2})"
@@ -0,0 +1,514 @@
+import logging
+import os
+import tempfile
+import threading
+from bisect import bisect_left
+from dataclasses import dataclass, field
+from functools import lru_cache
+
+import numpy as np
+from django.conf import settings
+from fpdf import FPDF
+from PIL import Image
+
+from .datasheets import datasheet_links, normalize_product_name
+
+logger = logging.getLogger(__name__)
+
+font_dir = os.path.join(settings.BASE_DIR, 'price_list_app', 'static', 'fonts')
+
+# Style -> TrueType file of the DejaVu family every price list is set in.
+font_files = {
+    '': 'DejaVuSans.ttf',
+    'B': 'DejaVuSans-Bold.ttf',
+    'I': 'DejaVuSans-Oblique.ttf',
+}
+
+# Columns whose text is wrapped on up to two lines in tables.
+wrapped_columns = ["Colour", "Product Name", "Design"]
+
+# Height of one line of text in table cells.
+line_height = 5
+
+# Vertical space (mm) taken by each part of a price list page. Drawing and
+# PriceListPDF.layout_price_list() both use these, so pagination stays exact.
+page_header_height = 10
+chapter_title_height = 10
+chapter_title_gap = 2
+banner_height = 20
+table_gap_before = 5
+table_gap_after = 10
+# A brand whose title would start closer than this to the bottom of the page
+# starts on a new page.
+chapter_min_space = 70
+# The table of contents: its title and the gap below it, and the bottom
+# margin its rows break at.
+toc_title_height = 8
+toc_title_gap = 1
+toc_bottom_margin = 15
+
+# Glyph widths (1/1000 em) of each font file by code point, with the width of
+# code points outside the table. Built once per process from the first
+# document that uses the font.
+_glyph_widths = {}
+_lock = threading.Lock()
+
+
+def _register_font(font):
+    with _lock:
+        if font['ttffile'] not in _glyph_widths:
+            missing = font['desc'].get('MissingWidth') or 500
+            _glyph_widths[font['ttffile']] = (np.asarray(font['cw'], dtype=np.int64), missing)
+
+
+@lru_cache(maxsize=65536)
+def _text_width(ttffile, text):
+    # Width of text in 1/1000 em, summed from the glyph table like
+    # FPDF.get_string_width() does character by character.
+    widths, missing = _glyph_widths[ttffile]
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32)
+    inside = codes < len(widths)
+    return int(widths[codes[inside]].sum()) + missing * int(len(codes) - inside.sum())
+
+
+@lru_cache(maxsize=65536)
+def _wrap(ttffile, font_size, text, cell_width, max_lines):
+    # Greedy word wrap: words are added while the line fits the cell minus
+    # its padding; stops after max_lines lines.
+    words = text.split(' ')
+    lines = []
+    current_line = words[0]
+    for word in words[1:]:
+        if _text_width(ttffile, current_line + ' ' + word) * font_size / 1000.0 <= cell_width - 4:
+            current_line += ' ' + word
+        else:
+            lines.append(current_line)
+            current_line = word
+        if len(lines) >= max_lines - 1:
+            break
+    lines.append(current_line)
+    return tuple(lines[:max_lines])
+
+
+# Non-interlaced copies of logos by (path, mtime).
+_converted_images = {}
+
+# Parsed image data by (path, mtime), shared by every document: parsing a PNG
+# with an alpha channel dominates the time spent on brand logos otherwise.
+_parsed_images = {}
+
+
+def non_interlaced(image_path):
+    """Return image_path, or the path of a non-interlaced copy of it, which
+    FPDF needs for PNGs. Copies are written once per process and replaced
+    atomically, so concurrent requests never read a partial file."""
+    try:
+        key = (image_path, os.path.getmtime(image_path))
+    except OSError:
+        return image_path
+    with _lock:
+        if key in _converted_images:
+            return _converted_images[key]
+    result = image_path
+    try:
+        with Image.open(image_path) as img:
+            if img.info.get('interlace'):
+                result = image_path.replace('.png', '_non_interlaced.png')
+                fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(result), suffix='.png')
+                os.close(fd)
+                img.save(tmp_path, interlace=False)
+                os.replace(tmp_path, result)
+    except Exception as e:
+        logger.error(f"Error converting image: {e}")
+        result = image_path
+    with _lock:
+        _converted_images[key] = result
+    return result
+
+
+@dataclass
+class TableLayout:
+    """Where and how one PriceListTable is drawn: column widths, the lines
+    of each header and cell, row heights and the rows a new page starts
+    before. page is the page of the table's title, counted from the first
+    page of content."""
+    brand: str
+    labels: list
+    widths: list
+    header_lines: list
+    header_height: float
+    rows: list
+    row_heights: list
+    page_breaks: set = field(default_factory=set)
+    new_page: bool = False
+    page: int = 0
+
+
+@dataclass
+class ChapterLayout:
+    """The tables of one product group, which starts on page."""
+    group: str
+    page: int
+    tables: list = field(default_factory=list)
+
+
+@dataclass
+class DocumentLayout:
+    """The pagination of a whole price list, known before drawing it."""
+    chapters: list
+    pages: int
+
+    def toc(self):
+        """Return the [(title, page), ...] entries of the table of contents."""
+        entries = []
+        for chapter in self.chapters:
+            entries.append((f"{chapter.group} Products", chapter.page))
+            for table in chapter.tables:
+                entries.append((f"{chapter.group}: {table.brand}", table.page))
+        return entries
+
+
+class PriceListPDF(FPDF):
+    """A landscape or portrait price list document set in DejaVu.
+
+    logos maps a brand to its logo file, with "NANOSUN" as the fallback.
+    With datasheet_links, product names that have a datasheet link to it.
+    String widths come from per-font glyph tables and wrapped cell text is
+    memoized, both shared by every document of the process; an instance
+    itself must only be used by one thread.
+    """
+
+    def __init__(self, orientation='P', background_image=None, logos=None, datasheet_links=False):
+        super().__init__(orientation)
+        self.background_image = background_image
+        self.logos = logos or {}
+        self.datasheet_links = datasheet_links
+        self.toc = []
+        self.current_group = None
+        for style, file_name in font_files.items():
+            self.add_font('DejaVu', style, os.path.join(font_dir, file_name), uni=True)
+
+    def get_string_width(self, s):
+        ttffile = self.current_font['ttffile']
+        if ttffile not in _glyph_widths:
+            _register_font(self.current_font)
+        return _text_width(ttffile, s) * self.font_size / 1000.0
+
+    def split_text(self, text, cell_width, max_lines=2):
+        ttffile = self.current_font['ttffile']
+        if ttffile not in _glyph_widths:
+            _register_font(self.current_font)
+        return list(_wrap(ttffile, self.font_size, text, cell_width, max_lines))
+
+    def image(self, name, x=None, y=None, w=0, h=0, type='', link=''):
+        if name not in self.images:
+            info = self._cached_image(name, (type or os.path.splitext(name)[1][1:]).lower())
+            if info is not None:
+                # _putimages() deletes the data of its own copy once written.
+                self.images[name] = dict(info, i=len(self.images) + 1)
+                # Soft masks need PDF 1.4, which _parsepng() would have set.
+                if 'smask' in info and self.pdf_version < '1.4':
+                    self.pdf_version = '1.4'
+        return super().image(name, x, y, w, h, type, link)
+
+    def _cached_image(self, name, kind):
+        parse = {'png': self._parsepng, 'jpg': self._parsejpg, 'jpeg': self._parsejpg}.get(kind)
+        if parse is None:
+            return None
+        try:
+            key = (name, os.path.getmtime(name))
+        except OSError:
+            return None
+        with _lock:
+            info = _parsed_images.get(key)
+        if info is None:
+            info = parse(name)
+            with _lock:
+                _parsed_images[key] = info
+        return info
+
+    def header(self):
+        if self.background_image:
+            self.image(self.background_image, x=0, y=0, w=self.w, h=self.h)
+        self.set_font('DejaVu', 'B', 10)
+        self.cell(0, page_header_height, 'Price List', 0, 1, 'C')
+
+    def chapter_title(self, title, group=False):
+        self.set_font('DejaVu', 'B', 10)
+        self.cell(0, chapter_title_height, title, 0, 1, 'L')
+        self.ln(chapter_title_gap)
+        link = self.add_link()
+        self.set_link(link, page=self.page_no())
+        if group:
+            self.toc.append((title, self.page_no(), link))
+        else:
+            self.toc.append((f"{self.current_group}: {title}", self.page_no(), link))
+
+    def chapter_body(self, body):
+        self.set_font('DejaVu', '', 8)
+        self.multi_cell(0, 10, body)
+        self.ln()
+
+    def add_banner(self, logo_filename, height=banner_height):
+        logo_path = self.logos.get(logo_filename, self.logos.get("NANOSUN"))
+        if logo_path and os.path.isfile(logo_path):
+            self.image(non_interlaced(logo_path), x=12, y=self.get_y(), h=height)
+        self.ln(height)
+
+    def _ttffile(self, style):
+        font = self.fonts['dejavu' + style]
+        if font['ttffile'] not in _glyph_widths:
+            _register_font(font)
+        return font['ttffile']
+
+    def layout_table(self, table):
+        """Return the TableLayout of a PriceListTable; pagination is left to
+        layout_price_list()."""
+        bold, regular = self._ttffile('B'), self._ttffile('')
+        font_size = 7 / self.k
+
+        def width(text):
+            return _text_width(bold, text) * font_size / 1000.0
+
+        labels = list(table.labels)
+        titles = [label.replace('_', ' ').title() for label in labels]
+        columns = [table.text.iloc[:, i].tolist() for i in range(len(labels))]
+        page_width = self.w - 2 * self.l_margin
+        widths = []
+        for label, title, values in zip(labels, titles, columns):
+            max_content_width = max(width(str(value)) for value in values) + 4
+            widths.append(max(max_content_width, width(title) + 4))
+            if label == "Product Name":
+                widths[-1] += 0.5 * width(' ')
+                widths[-1] += width(' ' * 3)
+        scale = page_width / sum(widths)
+        widths = [w * scale for w in widths]
+
+        header_lines = [list(_wrap(bold, font_size, title, w, 2)) for title, w in zip(titles, widths)]
+        max_lines = max([2] + [len(lines) for lines in header_lines])
+        widths = [w * 0.8 if len(lines) > 1 else w for w, lines in zip(widths, header_lines)]
+        scale = page_width / sum(widths)
+        widths = [w * scale for w in widths]
+
+        wrapped = [label in wrapped_columns for label in labels]
+        rows, row_heights = [], []
+        for row in zip(*columns):
+            row_lines = [
+                list(_wrap(regular, font_size, str(text), w, 2)) if wrap else [str(text)]
+                for text, w, wrap in zip(row, widths, wrapped)
+            ]
+            rows.append(row_lines)
+            row_heights.append(max([1] + [len(lines) for lines in row_lines]) * line_height)
+        return TableLayout(table.brand, labels, widths, header_lines, max_lines * line_height, rows, row_heights)
+
+    def layout_price_list(self, price_list):
+        """Return the DocumentLayout of a PriceList drawn by add_price_list().
+
+        The cursor moves exactly as drawing moves it, so the pages found here
+        are the pages the content ends up on.
+        """
+        top = self.t_margin + page_header_height
+        chapters = []
+        page = 0
+        for group, tables in price_list.groups():
+            page += 1
+            chapter = ChapterLayout(group, page)
+            y = top + chapter_title_height + chapter_title_gap
+            for table in tables:
+                layout = self.layout_table(table)
+                layout.new_page = y > self.h - chapter_min_space
+                if layout.new_page:
+                    page += 1
+                    y = top
+                layout.page = page
+                y += chapter_title_height
+                y += chapter_title_gap
+                y += banner_height
+                y += table_gap_before
+                y += layout.header_height
+                for i, row_height in enumerate(layout.row_heights):
+                    if y + row_height > self.page_break_trigger:
+                        page += 1
+                        layout.page_breaks.add(i)
+                        y = top + layout.header_height
+                    y += row_height
+                y += table_gap_after
+                chapter.tables.append(layout)
+            chapters.append(chapter)
+        return DocumentLayout(chapters, page)
+
+    def add_price_list(self, layout):
+        """Draw the chapters of a DocumentLayout, starting on a new page."""
+        first_page = self.page_no()
+        for chapter in layout.chapters:
+            self.add_page()
+            self.current_group = chapter.group
+            self.chapter_title(f"{chapter.group} Products", group=True)
+            for table in chapter.tables:
+                if table.new_page:
+                    self.add_page()
+                self.chapter_title(table.brand)
+                self.add_banner(table.brand)
+                self.ln(table_gap_before)
+                self.add_table(table)
+                self.ln(table_gap_after)
+        if self.page_no() - first_page != layout.pages:
+            logger.warning(f"Price list laid out on {layout.pages} pages but drawn on {self.page_no() - first_page}")
+
+    def add_table(self, layout):
+        """Draw a TableLayout, repeating its header row on every page it
+        spans."""
+        widths = layout.widths
+
+        def draw_headers():
+            y_start = self.get_y()
+            for lines, width in zip(layout.header_lines, widths):
+                x_start = self.get_x()
+                for i, line in enumerate(lines):
+                    self.set_xy(x_start, y_start + i * line_height)
+                    self.cell(width, line_height, line, 0, 0, 'C')
+                self.set_xy(x_start + width, y_start)
+            self.set_y(y_start)
+            x_start = self.l_margin
+            for width in widths:
+                self.set_xy(x_start, y_start)
+                self.multi_cell(width, layout.header_height, '', 1, 'C')
+                x_start += width
+
+        self.set_font('DejaVu', 'B', 7)
+        draw_headers()
+
+        self.set_font('DejaVu', '', 7)
+        links = [self.datasheet_links and label == 'Product Name' for label in layout.labels]
+        # One index per table instead of a stat of datasheet.csv per cell.
+        datasheets = datasheet_links() if any(links) else {}
+        for r, (row_lines, row_height) in enumerate(zip(layout.rows, layout.row_heights)):
+            if r in layout.page_breaks:
+                self.add_page()
+                draw_headers()
+            y_start = self.get_y()
+            for lines, width, has_link in zip(row_lines, widths, links):
+                x_start = self.get_x()
+                for i, line in enumerate(lines):
+                    self.set_xy(x_start, y_start + i * line_height)
+                    link = datasheets.get(normalize_product_name(line)) if has_link else None
+                    if link:
+                        self.set_text_color(0, 0, 255)
+                        self.cell(width, line_height, line, 0, 0, 'C', link=link)
+                        self.set_text_color(0)
+                    else:
+                        self.cell(width, line_height, line, 0, 0, 'C')
+                    self.set_xy(x_start + width, y_start)
+
+            self.set_y(y_start)
+            x_start = self.l_margin
+            for width in widths:
+                self.set_xy(x_start, y_start)
+                self.multi_cell(width, row_height, '', 1, 'C')
+                x_start += width
+
+    def add_table_of_contents(self, toc, background_image=None):
+        """Draw the table of contents of toc, [(title, page), ...] with pages
+        counted from the first page of content, on background_image. Page
+        numbers are shifted by the pages the table of contents takes, so the
+        content must follow it."""
+        data = self._prepare_data(toc)
+        font_size, row_height = self._toc_size(len(data))
+        toc_pages = self._toc_pages(len(data), row_height)
+        data = [[chapter, brand, page + toc_pages] for chapter, brand, page in data]
+
+        content_image, auto_page_break, margin = self.background_image, self.auto_page_break, self.b_margin
+        first_page = self.page_no()
+        self.background_image = background_image
+        self.set_auto_page_break(auto=True, margin=toc_bottom_margin)
+        self.add_page()
+        self._render_toc(data, font_size, row_height)
+        self.background_image = content_image
+        self.set_auto_page_break(auto_page_break, margin)
+        if self.page_no() - first_page != toc_pages:
+            logger.warning(f"Table of contents sized for {toc_pages} pages but drawn on {self.page_no() - first_page}")
+
+    def _toc_size(self, rows):
+        # Largest (font size, row height) step that fits rows on max_pages,
+        # found by bisection since fewer pages never need a larger step.
+        max_pages = 2
+        min_font_size = 6
+        sizes = [(10, 6)]
+        while sizes[-1][0] - 0.5 >= min_font_size:
+            font_size, row_height = sizes[-1]
+            sizes.append((font_size - 0.5, row_height - 0.2))
+        fits = bisect_left(range(len(sizes)), True, key=lambda i: self._toc_pages(rows, sizes[i][1]) <= max_pages)
+        return sizes[min(fits, len(sizes) - 1)]
+
+    def _toc_pages(self, rows, row_height):
+        # Pages _render_toc() takes: the title, then rows that each move to a
+        # new page below the header when they do not fit.
+        top = self.t_margin + page_header_height
+        bottom = self.h - toc_bottom_margin
+        pages = 1
+        y = top + toc_title_height + toc_title_gap
+        for _ in range(rows):
+            if y + row_height > bottom:
+                pages += 1
+                y = top
+            y += row_height
+        return pages
+
+    def save(self, path):
+        """Write the document to path in one piece, so readers see either the
+        previous file or the complete new one."""
+        data = self.output(dest='S').encode('latin-1')
+        fd, tmp_path = tempfile.mkstemp(dir=os.path.dirname(path), prefix='.tmp-', suffix='.pdf')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                f.write(data)
+                f.flush()
+                os.fsync(f.fileno())
+            os.chmod(tmp_path, 0o644)
+            os.replace(tmp_path, path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+
+    def _prepare_data(self, toc):
+        data = []
+        temp_title = ""
+        for title, page in toc:
+            if ": " in title:
+                group, brand = title.split(": ", 1)
+                data.append([temp_title, brand, page])
+                temp_title = ""
+            else:
+                temp_title = title
+        return data
+
+    def _render_toc(self, data, font_size, row_height):
+        self.set_font('DejaVu', 'B', font_size)
+        self.cell(0, toc_title_height, 'Table of Contents', 0, 1, 'C')
+        self.ln(toc_title_gap)
+        self.set_font('DejaVu', '', font_size - 2)
+        col_width = (self.w - 2 * self.l_margin) / 3
+        for i, row in enumerate(data):
+            self.set_text_color(0, 0, 0)
+            self.set_font('DejaVu', 'B', font_size - 2)
+            self.cell(col_width, row_height, str(row[0]), 0, 0, 'L')
+            x_chapter_end = self.get_x()
+            self.cell(col_width, row_height, str(row[1]), 0, 0, 'L')
+            x_brand_end = self.get_x()
+            self.cell(col_width, row_height, str(row[2]), 0, 0, 'R')
+            x_page_end = self.get_x()
+            y = self.get_y() + row_height
+            self._draw_dashed_line(x_chapter_end, y, x_brand_end - x_chapter_end, row_height)
+            self._draw_dashed_line(x_brand_end, y, x_page_end - x_brand_end, row_height)
+            self.ln(row_height)
+        self.ln(2)
+
+    def _draw_dashed_line(self, x, y, width, height, dash_length=2):
+        self.set_draw_color(0, 0, 0)
+        self.set_line_width(0.2)
+        x_start = x
+        x_end = x + width
+        while x_start < x_end:
+            self.line(x_start, y, x_start + dash_length, y)
+            x_start += dash_length * 2
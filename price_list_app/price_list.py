@@ -0,0 +1,117 @@
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from .formatting import format_table
+
+# Header of each column in the rendered price lists; price_label_<j>
+# columns are labelled per group by the configuration's headers.
+column_labels = {
+    'Group': 'Product Group',
+    'brand': 'Brand',
+    'product_name': 'Product Name',
+    'available': 'Available',
+    'available_cz': 'Available',
+    'delivery_month': 'Delivery',
+    'delivery_cw': 'CW',
+    'panel_power': 'Power(W)',
+    'panel_colour': 'Colour',
+    'panel_design': 'Design',
+    'length': 'Length',
+    'width': 'Width',
+    'height': 'Height',
+    'pcs_pal': 'Pcs Pal',
+    'pcs_ctn': 'Pcs ctn',
+}
+
+
+@dataclass
+class PriceListTable:
+    """The products of one brand within a group, as one table of a price
+    list. Columns left empty for every product of the brand are pruned."""
+    group: str
+    brand: str
+    columns: list
+    labels: list
+    values: pd.DataFrame
+    text: pd.DataFrame
+
+
+@dataclass
+class PriceList:
+    """A price list ready to render: the typed rows, their display strings
+    and the per brand tables, in the order they are printed."""
+    columns: list
+    labels: list
+    values: pd.DataFrame
+    text: pd.DataFrame
+    tables: list = field(default_factory=list)
+
+    def groups(self):
+        """Return [(group, [table, ...]), ...] in print order."""
+        result = []
+        for table in self.tables:
+            if not result or result[-1][0] != table.group:
+                result.append((table.group, []))
+            result[-1][1].append(table)
+        return result
+
+
+def build_price_list(df, columns, headers=None):
+    """Build the PriceList of the columns of df, which must include 'Group'
+    and 'brand' and be sorted in print order.
+
+    Cells are formatted once with format_table(). Groups keep the order of
+    df and brands are sorted within each group. headers maps a group to the
+    labels of its price_label_<j> columns.
+    """
+    values = df[columns].reset_index(drop=True)
+    text = format_table(values)
+    price_list = PriceList(columns, [column_labels.get(column, column) for column in columns], values, text)
+
+    table_columns = [column for column in columns if column not in ('Group', 'brand')]
+    blank = text[table_columns] == ''
+    partitions = text.groupby(['Group', 'brand'], sort=False).indices
+    empty = blank.groupby([text['Group'], text['brand']], sort=False).all()
+    group_order = {group: i for i, group in enumerate(pd.unique(text['Group']))}
+    for group, brand in sorted(partitions, key=lambda key: (group_order[key[0]], key[1])):
+        rows = partitions[(group, brand)]
+        kept = [column for column, is_empty in zip(table_columns, empty.loc[(group, brand)]) if not is_empty]
+        group_headers = (headers or {}).get(group, {})
+        labels = []
+        for column in kept:
+            label = column_labels.get(column, column)
+            labels.append(group_headers.get(label, label))
+        price_list.tables.append(PriceListTable(
+            group, brand, kept, labels, values.iloc[rows][kept], text.iloc[rows][kept],
+        ))
+    return price_list
+
+
+def _excel_column(column):
+    # Numbers stay numbers; zero and missing cells are left empty like in
+    # the PDF, and float32 values keep their shortest decimal form.
+    values = column.to_numpy()
+    if not pd.api.types.is_numeric_dtype(column.dtype) or pd.api.types.is_bool_dtype(column.dtype):
+        return pd.Series(np.where(column.isna(), None, values.astype(object)), index=column.index)
+    if values.dtype == np.float32:
+        values = values.astype(str).astype(np.float64)
+    blank = pd.isna(values) | (values == 0)
+    return pd.Series(np.where(blank, None, values.astype(object)), index=column.index)
+
+
+def write_excel(price_list, path):
+    """Write every row of price_list to an .xlsx file with typed cells,
+    numbers shown with 0 or 3 decimals and thousands separators."""
+    frame = pd.DataFrame({i: _excel_column(price_list.values[column]) for i, column in enumerate(price_list.columns)})
+    frame.columns = price_list.labels
+    with pd.ExcelWriter(path, engine='openpyxl') as writer:
+        frame.to_excel(writer, index=False)
+        sheet = next(iter(writer.sheets.values()))
+        for i, column in enumerate(price_list.columns):
+            if not pd.api.types.is_numeric_dtype(price_list.values[column].dtype):
+                continue
+            for (cell,) in sheet.iter_rows(min_row=2, min_col=i + 1, max_col=i + 1):
+                if isinstance(cell.value, (int, float)):
+                    cell.number_format = '#,##0' if float(cell.value).is_integer() else '#,##0.000'
@@ -0,0 +1,196 @@
+import numpy as np
+import pandas as pd
+
+from .formulas import compile_formula, formula_variables
+
+default_operation = '*'
+default_coefficient = 1.2
+
+
+def base_price_column(warehouse):
+    """Purchase price column the selling prices of a warehouse are based on."""
+    return 'bp_eur_cz' if warehouse == 'Decin' else 'bp_eur'
+
+
+def coefficient_matrix(groups, coefficients, num_prices):
+    """Return (multiply, coefficient) arrays of shape (len(groups),
+    num_prices): whether price label j of a group multiplies or adds, and by
+    what. Missing entries fall back to '*' and 1.2."""
+    multiply = np.ones((len(groups), num_prices), dtype=bool)
+    coefficient = np.full((len(groups), num_prices), default_coefficient)
+    for i, group in enumerate(groups):
+        group_coefficients = coefficients.get(group, {})
+        for j in range(num_prices):
+            operation = group_coefficients.get(f'operation_{j + 1}', default_operation)
+            if operation not in ('*', '+'):
+                raise ValueError(f"Unknown operation {operation!r} for {group} price label {j + 1}")
+            multiply[i, j] = operation == '*'
+            coefficient[i, j] = group_coefficients.get(f'coefficient_{j + 1}', default_coefficient)
+    return multiply, coefficient
+
+
+def round_prices(prices, panels):
+    """Round the prices of Panels (where panels is set, broadcast against
+    prices) to 4 decimals and all others to whole units, exactly as round()
+    rounds each price."""
+    panels = np.broadcast_to(panels, prices.shape)
+    rounded = np.round(prices, 0)
+    if panels.any():
+        # np.round(prices, 4) scales by 10**4 first, which tips prices lying
+        # halfway between two 4th decimals; round() each distinct one instead.
+        codes, uniques = pd.factorize(prices[panels])
+        rounded[panels] = np.array([round(price, 4) for price in uniques.tolist()] + [np.nan])[codes]
+    return rounded
+
+
+def highest_prices(base_prices, multiply, coefficient, panels, formulas=()):
+    """Return the rounded selling prices of shape (products, columns): each
+    base price array is multiplied by, or added to, coefficient where
+    multiply is set, and every column takes the highest price reached over
+    base_prices. multiply, coefficient and panels broadcast against
+    (products, columns). formulas lists (rows, column, kernel, variables)
+    whose kernel replaces the price of those rows in that column; kernels
+    are evaluated at the first of base_prices only.
+    """
+    prices = None
+    for base in base_prices:
+        base = np.asarray(base, dtype=np.float64)
+        candidate = np.where(multiply, base[:, None] * coefficient, base[:, None] + coefficient)
+        prices = candidate if prices is None else np.fmax(prices, candidate)
+    base = np.asarray(base_prices[0], dtype=np.float64)
+    for rows, j, kernel, variables in formulas:
+        prices[rows, j] = kernel({**variables, 'price': base[rows]})
+    return round_prices(prices, panels)
+
+
+def selling_prices(group, base_prices, coefficients, num_prices, variables=None):
+    """Return the selling prices of each row as an array of shape (rows,
+    num_prices).
+
+    group gives each row's product group and base_prices one or more arrays
+    of purchase prices; every price label takes the highest price reached
+    over them. A 'formula_<j>' entry in a group's coefficients replaces its
+    operation and coefficient and is priced from the first of base_prices
+    alone: a tiered formula need not be highest at the lowest or highest
+    base price, so no other base price is tried. variables holds the other
+    arrays formulas may use. Panels prices are rounded to 4 decimals, all
+    others to whole units.
+    """
+    codes, groups = pd.factorize(np.asarray(group, dtype=object))
+    multiply, coefficient = coefficient_matrix(groups, coefficients, num_prices)
+    formulas = []
+    for i, group in enumerate(groups):
+        for j in range(num_prices):
+            formula = coefficients.get(group, {}).get(f'formula_{j + 1}')
+            if formula:
+                rows = codes == i
+                row_variables = {name: np.asarray(values)[rows] for name, values in (variables or {}).items()}
+                formulas.append((rows, j, compile_formula(formula), row_variables))
+    panels = (np.asarray(groups, dtype=object) == 'Panels')[codes][:, None]
+    return highest_prices(base_prices, multiply[codes], coefficient[codes], panels, formulas)
+
+
+def frame_prices(df, coefficients, num_prices, base_columns):
+    """Return selling_prices() for the rows of df, priced from its
+    base_columns, with df's columns as formula variables."""
+    variables = {name: df[name].to_numpy(dtype=np.float64) for name in formula_variables if name in df.columns}
+    return selling_prices(df['Group'], [df[col] for col in base_columns], coefficients, num_prices, variables)
+
+
+def add_price_labels(df, coefficients, num_prices, base_columns):
+    """Add the price_label_1..num_prices columns to df, priced from the
+    base_columns of each row."""
+    prices = frame_prices(df, coefficients, num_prices, base_columns)
+    for j in range(num_prices):
+        df[f'price_label_{j + 1}'] = prices[:, j]
+    return df
+
+
+# Upper bounds of one simulate_prices call: scenarios, and scenarios x
+# products evaluated at once.
+MAX_SIMULATION_SCENARIOS = 500
+MAX_SIMULATION_CELLS = 20_000_000
+
+
+def simulate_prices(df, scenarios, keys=('Group', 'brand')):
+    """Price the products of df under every (operation, coefficient) scenario
+    at once and return statistics per scenario and key.
+
+    df is shaped like get_configuration_products(). The prices form a
+    scenarios x products matrix, rounded like real price labels. Returns
+    (key_frame, stats): key_frame lists the distinct keys with their product
+    count, and stats maps 'revenue', 'total_margin', 'min_price',
+    'max_price' and 'mean_price' to (scenarios, keys) arrays. Margins are
+    taken over the product's highest base price and weighted by its
+    availability. Products without a base price are left out.
+    """
+    if not scenarios or len(scenarios) > MAX_SIMULATION_SCENARIOS:
+        raise ValueError(f'Between 1 and {MAX_SIMULATION_SCENARIOS} scenarios are supported')
+    if len(scenarios) * len(df) > MAX_SIMULATION_CELLS:
+        raise ValueError(f'Too many scenarios for {len(df)} products')
+    for operation, _ in scenarios:
+        if operation not in ('*', '+'):
+            raise ValueError(f'Unknown operation {operation!r}')
+    df = df[df['base_price_min'].notna() & df['base_price_max'].notna()]
+    codes, key_frame = pd.MultiIndex.from_frame(df[list(keys)].astype(object)).factorize()
+    key_frame = key_frame.to_frame(index=False, name=list(keys))
+    key_frame['products'] = np.bincount(codes, minlength=len(key_frame))
+
+    multiply = np.array([operation == '*' for operation, _ in scenarios])[None, :]
+    coefficient = np.array([value for _, value in scenarios], dtype=np.float64)[None, :]
+    panels = (df['Group'].astype(object) == 'Panels').to_numpy()[:, None]
+    base_prices = [df[column].to_numpy(dtype=np.float64) for column in ('base_price_max', 'base_price_min')]
+    prices = highest_prices(base_prices, multiply, coefficient, panels).T
+
+    available = df['available'].to_numpy(dtype=np.float64)[None, :]
+    margin = (prices - df['base_price_max'].to_numpy(dtype=np.float64)[None, :]) * available
+
+    def per_key(ufunc, values, initial):
+        result = np.full((len(key_frame), len(scenarios)), initial)
+        ufunc.at(result, codes, values.T)
+        return result.T
+
+    revenue = per_key(np.add, prices * available, 0.0)
+    stats = {
+        'revenue': revenue,
+        'total_margin': per_key(np.add, margin, 0.0),
+        'min_price': per_key(np.minimum, prices, np.inf),
+        'max_price': per_key(np.maximum, prices, -np.inf),
+        'mean_price': per_key(np.add, prices, 0.0) / np.maximum(key_frame['products'].to_numpy(), 1),
+    }
+    return key_frame, stats
+
+
+def simulation_grid(operations, coefficients):
+    """Return the (operation, coefficient) scenarios of every combination of
+    operations and coefficients. Raises ValueError for a coefficient that is
+    not a finite number."""
+    values = [float(coefficient) for coefficient in coefficients]
+    for coefficient, value in zip(coefficients, values):
+        if not np.isfinite(value):
+            raise ValueError(f'Coefficient {coefficient!r} is not a finite number')
+    return [(operation, value) for operation in operations for value in values]
+
+
+def simulation_report(df, scenarios):
+    """Return simulate_prices() per group and per group and brand as
+    JSON-ready data."""
+    def rows(keys):
+        key_frame, stats = simulate_prices(df, scenarios, keys)
+        result = []
+        for i, key in enumerate(key_frame.to_dict('records')):
+            result.append({
+                **{name: value for name, value in key.items() if name != 'products'},
+                'products': int(key['products']),
+                'scenarios': [
+                    {name: round(float(values[s, i]), 4) for name, values in stats.items()}
+                    for s in range(len(scenarios))
+                ],
+            })
+        return result
+
+    return {
+        'scenarios': [{'operation': operation, 'coefficient': value} for operation, value in scenarios],
+        'groups': rows(['Group']),
+        'groups_and_brands': rows(['Group', 'brand']),
+    }
@@ -0,0 +1,86 @@
+import json
+from datetime import datetime
+
+from django.conf import settings
+
+from .datasheets import normalize_product_name
+from .filters import compile_filters, filter_inventory
+from .inventory import aggregate_products, get_inventory_snapshot, get_products, inventory_version, query_inventory
+from .reference import reference_data
+from .result_cache import cached_result, result_key
+
+# Entries of Configuration.filters that only change how documents are
+# rendered; they do not take part in the result cache key.
+rendering_options = ('NoBackground', 'NoTOC')
+
+
+def get_configuration_products(config, filters=None, copy=True):
+    """Return the products of a configuration as one row per group, brand and
+    product: its filters applied, availability adjusted to its warehouse and
+    lines aggregated, with the lowest and highest base price of each product.
+
+    filters replaces the configuration's stored filters. Results are cached
+    per inventory version; with copy=False the cached frame itself is
+    returned and must not be modified.
+    """
+    selected_groups = json.loads(config.selected_groups)
+    warehouse = config.warehouse
+    if filters is None:
+        filters = json.loads(config.filters)
+
+    data = reference_data()
+    # Handle dynamic selection of brands
+    if config.select_all_brands:
+        selected_brands = list(data['brands'])
+    else:
+        selected_brands = json.loads(config.selected_brands)
+
+    nomenclature_mapping, panel_mapping = data['nomenclature_mapping'], data['panel_mapping']
+    use_database = getattr(settings, 'INVENTORY_DATABASE', False)
+    if use_database:
+        # Read before querying: rows synced meanwhile are only ever newer.
+        version = inventory_version()
+        frame = indexes = snapshot = None
+    else:
+        # Also publishes data.csv first if it was replaced by hand
+        snapshot = get_inventory_snapshot(nomenclature_mapping)
+        version, frame, indexes, _ = snapshot
+
+    # Products are read from the per-warehouse product table unless a filter
+    # looks at individual lines, or panel_mapping misses a colour or design:
+    # aggregating would then skip the unmapped value for the next line's.
+    use_products = not use_database and not any(compile_filters(filters)) and all(
+        panel_mapping.get(value) is not None
+        for col in ('panel_colour', 'panel_design') for value in frame[col].cat.categories
+    )
+
+    def filter_and_aggregate():
+        if use_products:
+            df = filter_inventory(get_products(nomenclature_mapping, warehouse, snapshot), {}, selected_groups, selected_brands)
+            df['panel_colour'] = df['panel_colour'].map(panel_mapping)
+            df['panel_design'] = df['panel_design'].map(panel_mapping)
+            grouped_df = df
+        else:
+            if use_database:
+                df = query_inventory(selected_groups, selected_brands, filters, nomenclature_mapping)
+                df = filter_inventory(df, filters, selected_groups, selected_brands)
+            else:
+                df = filter_inventory(frame, filters, selected_groups, selected_brands, indexes)
+            df['delivery_month'] = df['delivery_ym']
+            df['panel_colour'] = df['panel_colour'].map(panel_mapping)
+            df['panel_design'] = df['panel_design'].map(panel_mapping)
+            # Prices are computed after aggregation from the lowest and
+            # highest base price of each product.
+            grouped_df = aggregate_products(df, warehouse)
+        grouped_df = grouped_df[grouped_df['available'] > 0]
+        grouped_df['product_key'] = grouped_df['product_name'].map(normalize_product_name)
+        return grouped_df
+
+    cache_key = result_key(
+        groups=selected_groups, brands=selected_brands, warehouse=warehouse,
+        filters={key: value for key, value in filters.items() if key not in rendering_options},
+        inventory_version=version, nomenclature_mapping=nomenclature_mapping, panel_mapping=panel_mapping,
+        # urgent_stocks is relative to today
+        day=datetime.today().date() if filters.get('urgent_stocks') else None,
+    )
+    return cached_result(cache_key, filter_and_aggregate, copy=copy)
@@ -0,0 +1,97 @@
+import os
+import threading
+
+from django.conf import settings
+
+from .models import BackgroundImage, Brand, Logo, NomenclatureMapping, PanelMapping, PriceLabel
+
+# Models whose rows make up the reference data. signals.py invalidates the
+# bundle whenever one of them is saved or deleted.
+reference_models = [NomenclatureMapping, PanelMapping, PriceLabel, Logo, Brand, BackgroundImage]
+
+# Touched on every invalidation so that the other worker processes, which do
+# not receive this process' signals, rebuild their bundle as well.
+stamp_file_path = os.path.join(settings.BASE_DIR, 'data', '.reference_stamp')
+
+_lock = threading.Lock()
+_generation = 0
+_cached = (None, None)
+
+
+def _stamp():
+    try:
+        return os.stat(stamp_file_path).st_mtime_ns
+    except OSError:
+        return None
+
+
+def invalidate_reference_data():
+    global _generation
+    with _lock:
+        _generation += 1
+    try:
+        with open(stamp_file_path, 'a'):
+            os.utime(stamp_file_path)
+    except OSError:
+        pass
+
+
+def _pricelabel_headers(price_labels):
+    headers = {}
+    other_headers = {}
+    for item in price_labels.values():
+        if item.product_group == 'Other':
+            other_headers = {
+                'price_label_1': item.price_label_1,
+                'price_label_2': item.price_label_2,
+                'price_label_3': item.price_label_3,
+                'price_label_4': item.price_label_4,
+            }
+        headers[item.product_group] = {
+            'price_label_1': item.price_label_1,
+            'price_label_2': item.price_label_2,
+            'price_label_3': item.price_label_3,
+            'price_label_4': item.price_label_4,
+        }
+    # Add fallback for groups not having specific headers
+    for group in headers:
+        for i in range(1, 5):
+            headers[group].setdefault(f'price_label_{i}', other_headers.get(f'price_label_{i}', f'price_label_{i}'))
+    headers['Other'] = other_headers  # Ensure 'Other' group is always included
+    return headers
+
+
+def _load():
+    price_labels = {item.product_group: item for item in PriceLabel.objects.all()}
+    return {
+        'nomenclature_mapping': {item.key: item.value for item in NomenclatureMapping.objects.all()},
+        'panel_mapping': {item.key: item.value for item in PanelMapping.objects.all()},
+        'price_labels': price_labels,
+        'pricelabel_headers': _pricelabel_headers(price_labels),
+        'logos': {os.path.splitext(logo.name)[0]: logo.file.path for logo in Logo.objects.all()},
+        'brands': list(Brand.objects.all().values_list('name', flat=True)),
+        'background_image': BackgroundImage.objects.first(),
+    }
+
+
+def reference_data():
+    """Return the cached reference data bundle.
+
+    Keys: nomenclature_mapping, panel_mapping, price_labels (product group ->
+    PriceLabel), pricelabel_headers, logos (name -> file path), brands and
+    background_image. The bundle is shared between requests and must not be
+    modified.
+    """
+    global _cached
+
+    def current_key():
+        return _generation, _stamp()
+
+    key, bundle = _cached
+    if key != current_key():
+        with _lock:
+            key = current_key()
+            if _cached[0] != key:
+                _cached = (key, _load())
+            bundle = _cached[1]
+    return bundle
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import threading
+from collections import OrderedDict
+
+from django.conf import settings
+
+# Filtered and aggregated frames of generate_files, keyed by result_key().
+# Least recently used entries are evicted once their total size exceeds
+# settings.RESULT_CACHE_BYTES; a frame larger than the budget is not kept.
+_lock = threading.Lock()
+_entries = OrderedDict()
+_size = 0
+_hits = 0
+_misses = 0
+
+
+def result_key(**parts):
+    """Return a canonical hash of parts; lists are treated as sets."""
+    def canonical(value):
+        if isinstance(value, dict):
+            return {str(k): canonical(v) for k, v in value.items()}
+        if isinstance(value, (list, tuple, set)):
+            return sorted((canonical(v) for v in value), key=lambda v: json.dumps(v, sort_keys=True, default=str))
+        return value
+    payload = json.dumps(canonical(parts), sort_keys=True, default=str)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def cached_result(key, build, copy=True):
+    """Return a copy of the frame cached under key, building and storing it
+    with build() on a miss. With copy=False the cached frame itself is
+    returned; the caller must not modify it."""
+    global _size, _hits, _misses
+    with _lock:
+        entry = _entries.get(key)
+        if entry is not None:
+            _entries.move_to_end(key)
+            _hits += 1
+            return entry[0].copy() if copy else entry[0]
+        _misses += 1
+
+    frame = build()
+    nbytes = int(frame.memory_usage(index=True, deep=True).sum())
+    limit = getattr(settings, 'RESULT_CACHE_BYTES', 0)
+    with _lock:
+        if nbytes <= limit and key not in _entries:
+            _entries[key] = (frame.copy() if copy else frame, nbytes)
+            _size += nbytes
+            while _size > limit:
+                _, (_, evicted) = _entries.popitem(last=False)
+                _size -= evicted
+    return frame
+
+
+def result_cache_stats():
+    with _lock:
+        return {'hits': _hits, 'misses': _misses, 'entries': len(_entries), 'bytes': _size}
+
+
+def clear_result_cache():
+    global _size
+    with _lock:
+        _entries.clear()
+        _size = 0
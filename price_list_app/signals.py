@@ -0,0 +1,16 @@
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+
+from .reference import invalidate_reference_data, reference_models
+
+
+def _reference_changed(sender, using=None, **kwargs):
+    # Signals fire before the admin's transaction commits; invalidating then
+    # would let another worker cache the old rows under the new stamp.
+    transaction.on_commit(invalidate_reference_data, using=using)
+
+
+def connect_signals():
+    for model in reference_models:
+        post_save.connect(_reference_changed, sender=model, dispatch_uid=f'reference_{model.__name__}_save')
+        post_delete.connect(_reference_changed, sender=model, dispatch_uid=f'reference_{model.__name__}_delete')
@@ -1,3 +1,721 @@
-from django.test import TestCase
+import io
+import json
+import os
+import shutil
+import tempfile
+from datetime import datetime, timedelta
+from types import SimpleNamespace
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.test import Client, SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+from fpdf import FPDF
+
+from . import inventory
+from .filters import compile_filters, filter_rows
+from .formulas import FormulaError, compile_formula
+from .models import Configuration, InventoryItem
+from .inventory import _bitmaps, _merge_delta, _normalize, apply_delta, bitmap_index_columns, range_index_columns
+from .pdf import PriceListPDF
+from .price_list import build_price_list
+from .pricing import selling_prices
+from .products import get_configuration_products
+from .result_cache import cached_result, clear_result_cache, result_cache_stats, result_key
+
+
+class CompileFormulaTests(SimpleTestCase):
+    def evaluate(self, formula, **variables):
+        variables.setdefault('price', np.array([10.0, 20.0, 30.0]))
+        return compile_formula(formula)({name: np.asarray(values, dtype=np.float64) for name, values in variables.items()})
+
+    def test_arithmetic(self):
+        np.testing.assert_allclose(self.evaluate('(price + 2) * 1.5'), [18, 33, 48])
+        np.testing.assert_allclose(self.evaluate('price ** 2 / 4 - 1'), [24, 99, 224])
+        np.testing.assert_allclose(self.evaluate('-price + 100'), [90, 80, 70])
+
+    def test_conditions(self):
+        np.testing.assert_allclose(
+            self.evaluate('price * (1.1 if available >= 100 else 1.2)', available=[50, 100, 150]),
+            [12, 22, 33],
+        )
+        np.testing.assert_allclose(
+            self.evaluate('price + (5 if 15 < price <= 30 and not available > 1 else 0)', available=[0, 0, 2]),
+            [10, 25, 30],
+        )
+
+    def test_functions(self):
+        np.testing.assert_allclose(self.evaluate('max(price * 1.05, price + 1, 12)'), [12, 21, 31.5])
+        np.testing.assert_allclose(self.evaluate('min(price, 25)'), [10, 20, 25])
+        np.testing.assert_allclose(self.evaluate('abs(price - 20)'), [10, 0, 10])
+        np.testing.assert_allclose(self.evaluate('round(price / 3)'), [3, 7, 10])
+        np.testing.assert_allclose(self.evaluate('round_to(price * 1.13, 0.5)'), [11.5, 22.5, 34])
+
+    def test_constant_is_broadcast_to_every_row(self):
+        result = self.evaluate('42')
+        self.assertEqual(result.shape, (3,))
+        np.testing.assert_allclose(result, [42, 42, 42])
+
+    def test_division_by_zero_does_not_raise(self):
+        result = self.evaluate('price / pcs_pal', pcs_pal=[0, 2, 0])
+        self.assertTrue(np.isinf(result[0]))
+        self.assertEqual(result[1], 10)
+
+    def test_rejected(self):
+        for formula in [
+            'price +',
+            'cost * 2',
+            'price.real',
+            '__import__("os").system("true")',
+            'open("data.csv")',
+            'max(price)',
+            'round(price, 2)',
+            'round_to(price)',
+            'max(price, key=1)',
+            'price if True else 1',
+            '"1" + price',
+            'price[0]',
+            '[price]',
+            'lambda: price',
+            'price // 2',
+            'price in (1, 2)',
+            'price * ' + '1 + ' * 200 + '1',
+        ]:
+            with self.subTest(formula=formula):
+                with self.assertRaises(FormulaError):
+                    compile_formula(formula)
+
+
+class SellingPricesTests(SimpleTestCase):
+    def test_panels_are_rounded_like_round(self):
+        prices = selling_prices(['Panels', 'Inverters'], [[0.1435, 102.5]], {'Panels': {'coefficient_1': 1.3}, 'Inverters': {'coefficient_1': 1.0}}, 1)
+        self.assertEqual(prices[0, 0], round(0.1435 * 1.3, 4))
+        self.assertEqual(prices[1, 0], 102)
+
+    def test_formulas_are_priced_at_the_first_base_price(self):
+        # Tiered: lower base prices get the higher markup.
+        coefficients = {'Inverters': {'formula_1': 'price * (2 if price < 10 else 1.1)', 'coefficient_2': 1.0}}
+        prices = selling_prices(['Inverters', 'Inverters'], [[12.0, 30.0], [8.0, 30.0]], coefficients, 2)
+        np.testing.assert_array_equal(prices, [[13, 12], [33, 30]])
+
+
+def inventory_frame(rows, seed):
+    rng = np.random.default_rng(seed)
+
+    def numbers(low, high, missing=0.1):
+        values = rng.integers(low, high, rows).astype(np.float64)
+        values[rng.random(rows) < missing] = np.nan
+        return values
+
+    def category(values):
+        column = pd.Categorical(rng.choice(values + [None], rows))
+        return column.add_categories(['unused'])
+
+    months = pd.to_datetime(rng.choice(['2024-01-01', '2024-03-01', '2024-06-01', None], rows))
+    df = pd.DataFrame({
+        'Group': category(['Panels', 'Inverters', 'Batteries']),
+        'brand': category(['JINKO', 'LONGI', 'HUAWEI', 'SOFAR']),
+        'panel_colour': category(['Black', 'Silver']),
+        'panel_design': category(['Bifacial', 'Glass foil']),
+        'panel_power': numbers(300, 700),
+        'length': numbers(1000, 2500),
+        'width': numbers(900, 1200),
+        'height': numbers(20, 50),
+        'available': numbers(0, 500, missing=0),
+        'pcs_pal': numbers(0, 40),
+        'pcs_ctn': numbers(0, 5),
+        'delivery_month': months,
+        'largest_area': rng.uniform(0.5, 3.5, rows),
+        'min_receipt_at': pd.Timestamp(datetime.today()) - pd.to_timedelta(rng.integers(0, 120, rows), unit='D'),
+    })
+    df['power_available'] = df['available'] * df['panel_power'] / 1000
+    return df
+
+
+def snapshot_indexes(df):
+    # Laid out like inventory._read_indexes() returns them.
+    ranges = {}
+    for column in range_index_columns:
+        order = np.argsort(df[column].to_numpy(), kind='stable')
+        ranges[column] = (order, df[column].to_numpy()[order])
+    bitmaps = {
+        column: _bitmaps(df[column].cat.codes.to_numpy(), len(df[column].cat.categories))
+        for column in bitmap_index_columns + ['Group'] if column in df.columns
+    }
+    return {'rows': len(df), 'ranges': ranges, 'bitmaps': bitmaps}
+
+
+def expected_rows(df, filters, groups, brands):
+    # The filters written out one by one with plain pandas.
+    mask = df['Group'].isin(groups) & df['brand'].isin(brands)
+    for key, column in [('panel_power_min', 'panel_power'), ('length_min', 'length'), ('width_min', 'width'),
+                        ('height_min', 'height'), ('available', 'available'), ('power_available', 'power_available')]:
+        if filters.get(key) is not None:
+            mask &= df[column] >= filters[key]
+    for key, column in [('panel_power_max', 'panel_power'), ('length_max', 'length'), ('width_max', 'width'), ('height_max', 'height')]:
+        if filters.get(key) is not None:
+            mask &= df[column] <= filters[key]
+    if filters.get('no_delivery_date'):
+        mask &= df['delivery_month'].isna()
+    else:
+        if filters.get('delivery_month_start'):
+            mask &= df['delivery_month'] >= pd.Timestamp(filters['delivery_month_start'])
+        if filters.get('delivery_month_end'):
+            mask &= df['delivery_month'] < pd.Timestamp(filters['delivery_month_end']) + pd.offsets.MonthBegin(1)
+    for key in ('panel_colour', 'panel_design'):
+        if filters.get(key):
+            mask &= df[key].isin(filters[key])
+    if filters.get('pal_available') is not None:
+        mask &= df['available'] / df['pcs_pal'] >= filters['pal_available']
+    if filters.get('ctn_available') is not None:
+        mask &= (df['pcs_ctn'] >= 1) & (df['available'] / df['pcs_ctn'] >= filters['ctn_available'])
+    if filters.get('length_height_limit'):
+        mask &= df['largest_area'] <= 2
+    if filters.get('urgent_stocks'):
+        mask &= df['min_receipt_at'] < pd.Timestamp(datetime.today() - timedelta(days=60))
+    return np.flatnonzero(mask.to_numpy())
+
+
+def random_filters(rng):
+    candidates = {
+        'panel_power_min': lambda: int(rng.integers(300, 700)),
+        'panel_power_max': lambda: int(rng.integers(300, 700)),
+        'length_min': lambda: int(rng.integers(1000, 2500)),
+        'length_max': lambda: int(rng.integers(1000, 2500)),
+        'width_max': lambda: int(rng.integers(900, 1200)),
+        'height_min': lambda: int(rng.integers(20, 50)),
+        'available': lambda: int(rng.integers(0, 500)),
+        'power_available': lambda: float(rng.uniform(0, 200)),
+        'panel_colour': lambda: list(rng.choice(['Black', 'Silver', 'Red'], rng.integers(1, 3), replace=False)),
+        'panel_design': lambda: list(rng.choice(['Bifacial', 'Glass foil'], 1)),
+        'pal_available': lambda: int(rng.integers(0, 30)),
+        'ctn_available': lambda: int(rng.integers(0, 100)),
+        'delivery_month_start': lambda: str(rng.choice(['2024-01', '2024-03'])),
+        'delivery_month_end': lambda: str(rng.choice(['2024-03', '2024-06'])),
+        'no_delivery_date': lambda: bool(rng.random() < 0.5),
+        'length_height_limit': lambda: bool(rng.random() < 0.5),
+        'urgent_stocks': lambda: bool(rng.random() < 0.5),
+    }
+    keys = rng.choice(list(candidates), rng.integers(0, 6), replace=False)
+    return {key: candidates[key]() for key in keys}
+
+
+class FilterRowsTests(SimpleTestCase):
+    def test_matches_pandas_with_and_without_indexes(self):
+        df = inventory_frame(2000, seed=7)
+        indexes = snapshot_indexes(df)
+        rng = np.random.default_rng(11)
+        for i in range(200):
+            filters = random_filters(rng)
+            groups = list(rng.choice(['Panels', 'Inverters', 'Batteries', 'Other'], rng.integers(1, 4), replace=False))
+            brands = list(rng.choice(['JINKO', 'LONGI', 'HUAWEI', 'SOFAR'], rng.integers(1, 5), replace=False))
+            with self.subTest(filters=filters, groups=groups, brands=brands):
+                expected = expected_rows(df, filters, groups, brands)
+                compiled = compile_filters(filters, groups, brands)
+                np.testing.assert_array_equal(filter_rows(df, compiled), expected)
+                np.testing.assert_array_equal(filter_rows(df, compiled, indexes), expected)
+
+    def test_indexes_of_another_frame_are_ignored(self):
+        df = inventory_frame(300, seed=3)
+        indexes = snapshot_indexes(df)
+        subset = df.iloc[::2].reset_index(drop=True)
+        compiled = compile_filters({'available': 100}, ['Panels'], ['JINKO', 'LONGI'])
+        np.testing.assert_array_equal(
+            filter_rows(subset, compiled, indexes),
+            expected_rows(subset, {'available': 100}, ['Panels'], ['JINKO', 'LONGI']),
+        )
+
+    def test_decimal_dimensions_meet_equal_bounds(self):
+        df = inventory_frame(3, seed=1)
+        df['length'] = ['332.4', '332.5', '1722']
+        df = _normalize(df)
+        indexes = snapshot_indexes(df)
+        for filters, rows in [
+            ({'length_min': 332.4}, [0, 1, 2]),
+            ({'length_max': 332.4}, [0]),
+            ({'length_min': 332.5, 'length_max': 332.5}, [1]),
+        ]:
+            with self.subTest(filters=filters):
+                compiled = compile_filters(filters)
+                np.testing.assert_array_equal(filter_rows(df, compiled), rows)
+                np.testing.assert_array_equal(filter_rows(df, compiled, indexes), rows)
+
+
+class TransliterateTests(SimpleTestCase):
+    def test_distinct_values_are_converted_once(self):
+        inventory._transliterate_value.cache_clear()
+        df = pd.DataFrame({
+            'brand': ['ŠKODA', 'ŠKODA', 'JINKO', None],
+            'product_name': ['Žluť', 'Panel', 'Žluť', 'Panel'],
+            'available': [1, 2, 3, 4],
+        })
+        converted, skipped = inventory.transliterate(df)
+        self.assertEqual(converted['brand'].tolist(), ['SKODA', 'SKODA', 'JINKO', None])
+        self.assertEqual(converted['product_name'].tolist(), ['Zlut', 'Panel', 'Zlut', 'Panel'])
+        self.assertEqual(converted['available'].tolist(), [1, 2, 3, 4])
+        self.assertEqual(df['brand'].tolist(), ['ŠKODA', 'ŠKODA', 'JINKO', None])
+        # 7 string cells, 2 distinct non-ASCII values.
+        self.assertEqual(skipped, 5)
+        # The next upload finds both in the LRU.
+        self.assertEqual(inventory.transliterate(df)[1], 7)
+
+
+class MergeDeltaTests(SimpleTestCase):
+    def setUp(self):
+        self.df = pd.DataFrame({'attribute_2': ['a', 'b', 'c', 'd'], 'available': [1, 2, 3, 4]})
+
+    def merge(self, upserts, deletes=()):
+        return _merge_delta(self.df, pd.DataFrame(upserts, columns=['attribute_2', 'available']), list(deletes), 'attribute_2')
+
+    def test_updates_keep_their_place_and_new_rows_are_appended(self):
+        df = self.merge([('e', 50), ('b', 20), ('f', 60), ('a', 10)])
+        self.assertEqual(df['attribute_2'].tolist(), ['a', 'b', 'c', 'd', 'e', 'f'])
+        self.assertEqual(df['available'].tolist(), [10, 20, 3, 4, 50, 60])
+
+    def test_deletes(self):
+        df = self.merge([('b', 20)], deletes=['c', 'a', 'missing'])
+        self.assertEqual(df['attribute_2'].tolist(), ['b', 'd'])
+        self.assertEqual(df.index.tolist(), [0, 1])
+
+    def test_only_deletes(self):
+        df = self.merge([], deletes=['d'])
+        self.assertEqual(df['attribute_2'].tolist(), ['a', 'b', 'c'])
+
+    def test_last_row_of_a_repeated_key_wins(self):
+        df = self.merge([('b', 20), ('e', 50), ('b', 21), ('e', 51)])
+        self.assertEqual(df['attribute_2'].tolist(), ['a', 'b', 'c', 'd', 'e'])
+        self.assertEqual(df['available'].tolist(), [1, 21, 3, 4, 51])
+
+    def test_existing_duplicate_keys(self):
+        self.df = pd.DataFrame({'attribute_2': ['a', 'b', 'a', 'c'], 'available': [1, 2, 3, 4]})
+        df = self.merge([('c', 40), ('e', 50)])
+        self.assertEqual(df['attribute_2'].tolist(), ['a', 'b', 'a', 'c', 'e'])
+        self.assertEqual(df['available'].tolist(), [1, 2, 3, 40, 50])
+        df = self.merge([('a', 10)])
+        self.assertEqual(df['attribute_2'].tolist(), ['a', 'b', 'c'])
+        self.assertEqual(df['available'].tolist(), [10, 2, 4])
+
+
+INVENTORY_CSV = """\
+product_name,status,bp_eur,bp_eur_cz,delivery_month,available,available_cz,released_rtd,brand,panel_colour,panel_design,panel_power,inverter_power,nomenclature_group,delivery_cw,length,height,width,pcs_ctn,pcs_pal,available_10_only,available_15_only,attribute_2,min_receipt_date,max_receipt_date
+JINKO 440W Black,A,0.14,0.15,03/2024,100,40,0,JINKO,Black,Bifacial,440,0,PAN_JNK,,1722.0,30.0,1134.0,0,36,0,0,A-1,1704067200000.0,1704067200000.0
+LONGI 455W Silver,A,0.13,0.13,04/2024,200,0,0,LONGI,Silver,Glass foil,455,0,PAN_LNG,,1903.5,35.0,1134.0,0,31,0,0,A-2,1704067200000.0,1704067200000.0
+HUAWEI SUN2000-10KTL,A,1020.0,1030.0,,12,12,0,HUAWEI,,,0,10000,INV_HUA,,525.0,262.0,470.0,1,0,0,0,A-3,1709251200000.0,1709251200000.0
+"""
+
+
+class InventoryStoreTestCase(SimpleTestCase):
+    """Runs each test against a data.csv and a snapshot store in a
+    temporary directory."""
+
+    def setUp(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        csv_path = os.path.join(directory, 'data.csv')
+        with open(csv_path, 'w') as f:
+            f.write(INVENTORY_CSV)
+        os.mkdir(os.path.join(directory, 'snapshots'))
+        for name, value in [('csv_file_path', csv_path), ('store_dir', os.path.join(directory, 'snapshots')),
+                            ('_cached', (None, None, None, None)), ('_synced_version', None)]:
+            patcher = mock.patch.object(inventory, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+
+class SnapshotTests(InventoryStoreTestCase):
+    def test_snapshot_reads_back_as_the_parsed_csv(self):
+        version, df, indexes, _ = inventory._load_version(with_indexes=True)
+        pd.testing.assert_frame_equal(df.copy(), inventory._add_derived(inventory._read_csv()))
+
+        # Numeric columns are read-only maps of the snapshot files.
+        for col in ('available', 'length', 'delivery_month'):
+            values = df[col].to_numpy()
+            self.assertIsInstance(values.base, np.memmap)
+            self.assertFalse(values.flags.writeable)
+
+        self.assertEqual(indexes['rows'], 3)
+        for col, (order, values) in indexes['ranges'].items():
+            np.testing.assert_array_equal(values, df[col].to_numpy()[order])
+            self.assertTrue((np.diff(values) >= 0).all())
+        for col, bitmaps in indexes['bitmaps'].items():
+            np.testing.assert_array_equal(bitmaps, _bitmaps(df[col].cat.codes.to_numpy(), len(df[col].cat.categories)))
+
+
+class VersionedStoreTests(InventoryStoreTestCase):
+    nomenclature_mapping = {'PAN': 'Panels', 'INV': 'Inverters'}
+
+    def test_publish_and_read_back(self):
+        self.assertIsNone(inventory.inventory_version())
+        version, df = inventory._load_version()
+        self.assertEqual(version, 1)
+        self.assertEqual(df['attribute_2'].tolist(), ['A-1', 'A-2', 'A-3'])
+
+        published = inventory._read_csv().iloc[[2, 0]]
+        self.assertEqual(inventory.publish_inventory(published, 'hash'), 2)
+        self.assertEqual(inventory.inventory_version(), 2)
+        self.assertEqual(inventory.last_payload_hash(), 'hash')
+        version, df = inventory._load_version()
+        self.assertEqual(version, 2)
+        self.assertEqual(df['attribute_2'].tolist(), ['A-3', 'A-1'])
+        self.assertEqual(df['available'].tolist(), [12, 100])
+        self.assertEqual(df['delivery_ym'].astype(object).tolist()[1], '2024-03')
+        # data.csv is rewritten as the export of the published version.
+        self.assertEqual(pd.read_csv(inventory.csv_file_path)['attribute_2'].tolist(), ['A-3', 'A-1'])
+
+    def test_snapshot_is_pinned_to_its_version(self):
+        snapshot = inventory.get_inventory_snapshot(self.nomenclature_mapping)
+        self.assertEqual(snapshot[0], 1)
+        for _ in range(inventory.KEEP_VERSIONS + 1):
+            inventory.publish_inventory(inventory._read_csv().iloc[:1])
+
+        # The cached version is kept while newer ones are collected.
+        self.assertIn(1, inventory._stored_versions())
+        self.assertEqual(snapshot[1]['attribute_2'].tolist(), ['A-1', 'A-2', 'A-3'])
+        products = inventory.get_products(self.nomenclature_mapping, 'Rotterdam', snapshot)
+        self.assertEqual(products['product_name'].tolist(), ['JINKO 440W Black', 'LONGI 455W Silver'])
+
+        snapshot = inventory.get_inventory_snapshot(self.nomenclature_mapping)
+        self.assertEqual(snapshot[0], inventory.KEEP_VERSIONS + 2)
+        self.assertEqual(snapshot[1]['attribute_2'].tolist(), ['A-1'])
+
+    def test_old_versions_are_collected(self):
+        for version in range(1, 5):
+            self.assertEqual(inventory.publish_inventory(inventory._read_csv()), version)
+            self.assertEqual(
+                sorted(inventory._stored_versions()),
+                list(range(max(1, version - inventory.KEEP_VERSIONS + 1), version + 1)),
+            )
+
+    def test_data_csv_replaced_by_hand_is_imported(self):
+        self.assertEqual(inventory._load_version()[0], 1)
+        with open(inventory.csv_file_path, 'w') as f:
+            f.write(''.join(INVENTORY_CSV.splitlines(keepends=True)[:3]))
+
+        version, df = inventory._load_version()
+        self.assertEqual(version, 2)
+        self.assertEqual(df['attribute_2'].tolist(), ['A-1', 'A-2'])
+        self.assertIsNone(inventory.last_payload_hash())
+        # Importing does not rewrite the file.
+        self.assertEqual(open(inventory.csv_file_path).read(), ''.join(INVENTORY_CSV.splitlines(keepends=True)[:3]))
+        self.assertEqual(inventory._load_version()[0], 2)
+
+
+class ProductTableTests(InventoryStoreTestCase):
+    nomenclature_mapping = {'PAN': 'Panels', 'INV': 'Inverters'}
+
+    def publish_lines(self, nomenclature_groups):
+        # Several receipt lines per product, some out of stock in a warehouse.
+        df = inventory._read_csv().iloc[[0, 1, 2, 0, 1, 0]].reset_index(drop=True)
+        df['available'] = [100, 200, 12, 30, 0, 5]
+        df['available_cz'] = [40, 0, 12, 30, 0, 0]
+        df['bp_eur'] = [0.14, 0.13, 1020.0, 0.12, 0.11, 0.16]
+        df['bp_eur_cz'] = [0.15, 0.13, 1030.0, 0.17, 0.11, 0.13]
+        df['delivery_month'] = pd.to_datetime(['2024-03-01', '2024-04-01', None, '2024-01-01', '2024-05-01', None])
+        df['nomenclature_group'] = nomenclature_groups
+        inventory.publish_inventory(df)
+        return inventory.get_inventory_snapshot(self.nomenclature_mapping)
+
+    def assert_tables_match_lines(self, snapshot):
+        frame = snapshot[1]
+        for warehouse in inventory.warehouses:
+            with self.subTest(warehouse=warehouse):
+                expected = inventory.aggregate_products(frame.assign(delivery_month=frame['delivery_ym']), warehouse)
+                products = inventory.get_products(self.nomenclature_mapping, warehouse, snapshot)
+                # Categories may include groups without stock in warehouse.
+                pd.testing.assert_frame_equal(products, expected, check_categorical=False)
+
+    def test_stored_tables_match_the_lines(self):
+        snapshot = self.publish_lines(['PAN_JNK', 'PAN_LNG', 'INV_HUA', 'PAN_JNK', 'PAN_LNG', 'PAN_JNK'])
+        self.assertEqual(sorted(snapshot[3]), sorted(inventory.warehouses))
+        self.assert_tables_match_lines(snapshot)
+
+    def test_products_spanning_nomenclature_groups_are_aggregated_per_request(self):
+        # Only the Rotterdam stock includes the line filed under PAN_JN2.
+        snapshot = self.publish_lines(['PAN_JNK', 'PAN_LNG', 'INV_HUA', 'PAN_JNK', 'PAN_LNG', 'PAN_JN2'])
+        self.assertEqual(list(snapshot[3]), ['Decin'])
+        self.assert_tables_match_lines(snapshot)
+
+
+class ApplyDeltaTests(InventoryStoreTestCase):
+    def test_round_trip_through_data_csv(self):
+        # Rows as the ERP sends them: every column, months as MM/YYYY.
+        upserts = pd.read_csv(io.StringIO(INVENTORY_CSV), dtype=str).iloc[[1, 1]]
+        upserts['attribute_2'] = ['A-2', 'A-4']
+        upserts['delivery_month'] = ['06/2024', '07/2024']
+        upserts['available'] = ['7', '5']
+        upserts['length'] = ['1903.5', '332.4']
+        version = apply_delta(upserts, ['A-3'])
+
+        df = pd.read_csv(inventory.csv_file_path, dtype={'delivery_month': str})
+        self.assertEqual(df.columns.tolist(), INVENTORY_CSV.splitlines()[0].split(','))
+        self.assertEqual(df['attribute_2'].tolist(), ['A-1', 'A-2', 'A-4'])
+        self.assertEqual(df['delivery_month'].tolist(), ['03/2024', '06/2024', '07/2024'])
+        self.assertEqual(df['available'].tolist(), [100, 7, 5])
+        self.assertEqual(df['length'].tolist(), [1722.0, 1903.5, 332.4])
+
+        self.assertEqual(inventory.inventory_version(), version)
+        _, frame = inventory._load_version()
+        self.assertEqual(frame['delivery_ym'].tolist(), ['2024-03', '2024-06', '2024-07'])
+        self.assertEqual(frame['available'].tolist(), [100, 7, 5])
+
+
+class InventoryItemTests(InventoryStoreTestCase, TestCase):
+    nomenclature_mapping = {'PAN': 'Panels', 'INV': 'Inverters'}
+
+    def items(self):
+        return list(InventoryItem.objects.values_list('inventory_version', 'position', 'attribute_2'))
+
+    def test_repeated_keys_are_kept(self):
+        df = inventory._read_csv()
+        df['attribute_2'] = ['A-1', 'A-1', 'A-2']
+        inventory.sync_inventory_items(df, 1)
+        self.assertEqual(self.items(), [(1, 0, 'A-1'), (1, 1, 'A-1'), (1, 2, 'A-2')])
+        inventory.sync_inventory_items(df.iloc[1:], 2)
+        self.assertEqual(self.items(), [(2, 0, 'A-1'), (2, 1, 'A-2')])
+
+    def test_query_catches_up_with_the_store(self):
+        df = inventory.query_inventory(['Panels'], ['JINKO', 'LONGI'], {}, self.nomenclature_mapping)
+        self.assertEqual(df['attribute_2'].tolist(), ['A-1', 'A-2'])
+        self.assertEqual(self.items(), [(1, 0, 'A-1'), (1, 1, 'A-2'), (1, 2, 'A-3')])
+
+        # Up to date: the snapshot is not loaded again.
+        with mock.patch.object(inventory, '_load_version', side_effect=AssertionError):
+            inventory.query_inventory(['Panels'], ['JINKO'], {}, self.nomenclature_mapping)
+
+        inventory.publish_inventory(inventory._read_csv().iloc[1:])
+        df = inventory.query_inventory(['Panels', 'Inverters'], ['JINKO', 'LONGI', 'HUAWEI'], {}, self.nomenclature_mapping)
+        self.assertEqual(df['attribute_2'].tolist(), ['A-2', 'A-3'])
+        self.assertEqual(self.items(), [(2, 0, 'A-2'), (2, 1, 'A-3')])
+
+
+class ResultCacheTests(SimpleTestCase):
+    def setUp(self):
+        clear_result_cache()
+        self.addCleanup(clear_result_cache)
+
+    def frame(self):
+        return pd.DataFrame({'value': np.arange(100, dtype=np.int64)})
+
+    def cache(self, key, copy=True):
+        build = mock.Mock(return_value=self.frame())
+        frame = cached_result(key, build, copy=copy)
+        return frame, build.called
+
+    def counts(self, before):
+        after = result_cache_stats()
+        return after['hits'] - before['hits'], after['misses'] - before['misses'], after['entries']
+
+    def test_lists_are_keyed_as_sets(self):
+        self.assertEqual(result_key(brands=['A', 'B'], filters={'x': 1}), result_key(filters={'x': 1}, brands=['B', 'A']))
+        self.assertNotEqual(result_key(brands=['A']), result_key(brands=['A', 'B']))
+
+    def test_hits_and_misses(self):
+        before = result_cache_stats()
+        first, built = self.cache('a')
+        self.assertTrue(built)
+        second, built = self.cache('a')
+        self.assertFalse(built)
+        self.assertIsNot(first, second)
+        pd.testing.assert_frame_equal(first, second)
+        self.assertIs(self.cache('a', copy=False)[0], self.cache('a', copy=False)[0])
+        self.assertEqual(self.counts(before), (3, 1, 1))
+
+    def test_least_recently_used_entries_are_evicted(self):
+        nbytes = int(self.frame().memory_usage(index=True, deep=True).sum())
+        with override_settings(RESULT_CACHE_BYTES=2 * nbytes):
+            self.cache('a')
+            self.cache('b')
+            self.assertFalse(self.cache('a')[1])
+            self.cache('c')
+            self.assertEqual(result_cache_stats()['bytes'], 2 * nbytes)
+            self.assertFalse(self.cache('a')[1])
+            self.assertTrue(self.cache('b')[1])
+
+    def test_frames_over_budget_are_not_kept(self):
+        nbytes = int(self.frame().memory_usage(index=True, deep=True).sum())
+        with override_settings(RESULT_CACHE_BYTES=nbytes - 1):
+            self.cache('a')
+            self.assertTrue(self.cache('a')[1])
+            self.assertEqual(result_cache_stats()['entries'], 0)
+
+
+@override_settings(RESULT_CACHE_BYTES=1 << 20)
+class ConfigurationTestCase(InventoryStoreTestCase):
+    """An InventoryStoreTestCase with fixed reference data and an empty
+    result cache."""
+    reference = {
+        'brands': ['JINKO', 'LONGI', 'HUAWEI'],
+        'nomenclature_mapping': {'PAN': 'Panels', 'INV': 'Inverters'},
+        'panel_mapping': {'Black': 'Black', 'Silver': 'Silver', 'Bifacial': 'Bifacial', 'Glass foil': 'Glass foil'},
+    }
+
+    def setUp(self):
+        super().setUp()
+        clear_result_cache()
+        self.addCleanup(clear_result_cache)
+        patcher = mock.patch('price_list_app.products.reference_data', return_value=self.reference)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+
+class ConfigurationProductsTests(ConfigurationTestCase):
+    def config(self, **filters):
+        return SimpleNamespace(selected_groups='["Panels"]', warehouse='Rotterdam', filters=json.dumps(filters),
+                               select_all_brands=True, selected_brands='[]')
+
+    def test_rendering_options_share_a_cache_entry(self):
+        before = result_cache_stats()
+        df = get_configuration_products(self.config(NoTOC=False, NoBackground=False))
+        self.assertEqual(df['product_name'].tolist(), ['JINKO 440W Black', 'LONGI 455W Silver'])
+        pd.testing.assert_frame_equal(get_configuration_products(self.config(NoTOC=True, NoBackground=True)), df)
+        after = result_cache_stats()
+        self.assertEqual((after['misses'] - before['misses'], after['hits'] - before['hits']), (1, 1))
+        get_configuration_products(self.config(available=150))
+        self.assertEqual(result_cache_stats()['misses'] - before['misses'], 2)
+
+
+@override_settings(PRICE_API_TOKEN='secret')
+class ApiTestCase(ConfigurationTestCase, TestCase):
+    url_name = None
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('desk', password='desk')
+        self.config = Configuration.objects.create(
+            user=self.user, name='Desk', warehouse='Rotterdam', num_prices=2,
+            selected_groups='["Panels", "Inverters"]', select_all_brands=True, selected_brands='[]',
+            coefficients=json.dumps({'Panels': {'coefficient_1': 1.5, 'header_1': 'Retail'}}),
+            filters=json.dumps({'available': 50, 'panel_colour': ['Black', 'Silver']}),
+        )
+        self.url = reverse(self.url_name, args=[self.config.id])
+        self.client = Client(enforce_csrf_checks=True, HTTP_AUTHORIZATION='Bearer secret')
+
+    def post(self, payload, **extra):
+        return self.client.post(self.url, payload if isinstance(payload, str) else json.dumps(payload),
+                                content_type='application/json', **extra)
+
+
+class QuoteApiTests(ApiTestCase):
+    url_name = 'quote_api'
+
+    def names(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return [product['product_name'] for product in response.json()['products']]
+
+    def test_authentication(self):
+        self.assertEqual(Client().get(self.url).status_code, 401)
+        self.assertEqual(Client(HTTP_AUTHORIZATION='Bearer wrong').get(self.url).status_code, 403)
+        self.assertEqual(Client(HTTP_AUTHORIZATION='Basic secret').get(self.url).status_code, 403)
+        with override_settings(PRICE_API_TOKEN=''):
+            self.assertEqual(Client(HTTP_AUTHORIZATION='Bearer ').get(self.url).status_code, 403)
+
+    def test_sessions_keep_the_csrf_check(self):
+        client = Client(enforce_csrf_checks=True)
+        client.force_login(self.user)
+        self.assertEqual(client.get(self.url).status_code, 200)
+        self.assertEqual(client.post(self.url, '{}', content_type='application/json').status_code, 403)
+
+    def test_quote(self):
+        response = self.client.get(self.url, {'product': ['jinko  440w black', 'Unknown']})
+        self.assertEqual(self.names(response), ['JINKO 440W Black'])
+        data = response.json()
+        self.assertEqual(data['missing'], ['Unknown'])
+        self.assertEqual(data['products'][0]['available'], 60)
+        self.assertEqual(data['products'][0]['prices'], [
+            {'label': 'Retail', 'price': round(0.14 * 1.5, 4)},
+            {'label': 'price_label_2', 'price': round(0.14 * 1.2, 4)},
+        ])
+        self.assertEqual(self.names(self.post({})), ['JINKO 440W Black', 'LONGI 455W Silver'])
+
+    def test_extra_filters_only_narrow(self):
+        self.assertEqual(self.names(self.post({'filters': {'available': 10}})), ['JINKO 440W Black', 'LONGI 455W Silver'])
+        self.assertEqual(self.names(self.post({'filters': {'available': 150}})), ['LONGI 455W Silver'])
+        self.assertEqual(self.names(self.post({'filters': {'panel_colour': ['Black', 'Red']}})), ['JINKO 440W Black'])
+
+    def test_errors(self):
+        for payload in ['{', '[1]', {'products': 'JINKO'}, {'filters': []}, {'filters': {'panel_colour': ['Red']}}]:
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+        self.assertEqual(self.client.put(self.url).status_code, 405)
+        self.assertEqual(self.client.get(reverse('quote_api', args=[self.config.id + 1])).status_code, 404)
+
+
+class SimulateApiTests(ApiTestCase):
+    url_name = 'simulate_api'
+
+    def report(self, response):
+        self.assertEqual(response.status_code, 200, response.content)
+        return response.json()
+
+    def test_report(self):
+        data = self.report(self.client.get(self.url, {'coefficient': ['1.5', '2']}))
+        self.assertEqual(data['scenarios'], [{'operation': '*', 'coefficient': 1.5}, {'operation': '*', 'coefficient': 2.0}])
+        [panels] = data['groups']
+        self.assertEqual((panels['Group'], panels['products']), ('Panels', 2))
+        self.assertAlmostEqual(panels['scenarios'][0]['revenue'], 0.21 * 60 + 0.195 * 200)
+        self.assertAlmostEqual(panels['scenarios'][1]['revenue'], 0.28 * 60 + 0.26 * 200)
+        self.assertEqual([row['brand'] for row in data['groups_and_brands']], ['JINKO', 'LONGI'])
+
+        data = self.report(self.post({'coefficients': [1.5], 'filters': {'available': 150}}))
+        self.assertEqual(data['groups'][0]['products'], 1)
+
+    def test_errors(self):
+        for coefficient in ['nan', 'inf', '-inf', 'abc']:
+            with self.subTest(coefficient=coefficient):
+                self.assertEqual(self.client.get(self.url, {'coefficient': coefficient}).status_code, 400)
+        for payload in ['{"coefficients": [NaN]}', '{"coefficients": [1.2, Infinity]}', {'coefficients': [None]},
+                        {'coefficients': []}, {'coefficients': 1.2}, {'coefficients': [1.2], 'operations': ['/']}]:
+            with self.subTest(payload=payload):
+                response = self.post(payload)
+                self.assertEqual(response.status_code, 400)
+                self.assertIn('error', response.json())
+
+
+class PriceListPDFTests(SimpleTestCase):
+    def price_list(self, seed, rows):
+        rng = np.random.default_rng(seed)
+        words = ['JINKO', 'Tiger', 'Neo', 'N-type', '440W', 'Bifacial', 'Full', 'Black', 'Dual', 'Glass']
+        df = pd.DataFrame({
+            'Group': rng.choice(['Panels', 'Inverters', 'Batteries'], rows),
+            'brand': rng.choice(['JINKO', 'LONGI', 'HUAWEI', 'SOFAR', 'TRINA'], rows),
+            'product_name': [' '.join(rng.choice(words, rng.integers(1, 9))) for _ in range(rows)],
+            'panel_colour': rng.choice(['Black', 'Silver frame with white backsheet', None], rows),
+            'available': rng.integers(0, 5000, rows),
+            'length': rng.uniform(500, 2500, rows).round(1),
+        })
+        df = df.sort_values(['Group', 'brand'], kind='stable')
+        return build_price_list(df, list(df.columns))
+
+    def test_layout_pages_are_the_drawn_pages(self):
+        for orientation in ['L', 'P']:
+            for seed, rows in [(0, 1), (1, 12), (2, 60), (3, 250), (4, 700)]:
+                with self.subTest(orientation=orientation, rows=rows):
+                    pdf = PriceListPDF(orientation=orientation)
+                    layout = pdf.layout_price_list(self.price_list(seed, rows))
+                    with self.assertNoLogs('price_list_app.pdf', 'WARNING'):
+                        pdf.add_price_list(layout)
+                    self.assertEqual(pdf.page_no(), layout.pages)
+                    self.assertEqual([(title, page) for title, page, _ in pdf.toc], layout.toc())
+
+    def test_string_width_matches_fpdf(self):
+        pdf = PriceListPDF(orientation='L')
+        for style, size in [('', 7), ('B', 7), ('B', 10), ('I', 12.5)]:
+            pdf.set_font('DejaVu', style, size)
+            for text in ['', 'JINKO 440W Black', 'Žluťoučký kůň 1 234,5 €', '\u4e2d\u6587 \U0001F600', ' ' * 3]:
+                with self.subTest(style=style, size=size, text=text):
+                    self.assertEqual(pdf.get_string_width(text), FPDF.get_string_width(pdf, text))
+
+    def test_toc_pages_are_the_drawn_pages(self):
+        for orientation in ['L', 'P']:
+            for rows in range(1, 200, 7):
+                with self.subTest(orientation=orientation, rows=rows):
+                    toc = [('Panels Products', 1)] + [(f'Panels: BRAND {i}', 1 + i // 10) for i in range(rows)]
+                    pdf = PriceListPDF(orientation=orientation)
+                    row_height = pdf._toc_size(rows)[1]
+                    with self.assertNoLogs('price_list_app.pdf', 'WARNING'):
+                        pdf.add_table_of_contents(toc)
+                    self.assertEqual(pdf.page_no(), pdf._toc_pages(rows, row_height))
@@ -11,6 +11,8 @@ urlpatterns = [
     path('select_products/', views.select_products, name='select_products'),
     path('input_coefficients/<int:config_id>/', views.input_coefficients, name='input_coefficients'),
     path('generate_files/<int:config_id>/', views.generate_files, name='generate_files'),
+    path('api/quote/<int:config_id>/', views.quote_api, name='quote_api'),
+    path('api/simulate/<int:config_id>/', views.simulate_api, name='simulate_api'),
     path('results/', views.results, name='results'),
     path('download_pdf/', views.download_pdf, name='download_pdf'),
     path('download_excel/', views.download_excel, name='download_excel'),
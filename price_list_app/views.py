@@ -1,22 +1,31 @@
-from fpdf import FPDF
 import os
 import json
+import hashlib
+import hmac
+from functools import wraps
+import numpy as np
 import pandas as pd
-from PIL import Image
 from django.shortcuts import render, redirect, get_object_or_404
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth import logout, login
 from django.contrib.auth.forms import AuthenticationForm
 from django.conf import settings
-from .forms import SelectionForm, CoefficientForm
-from .models import Configuration, NomenclatureMapping, PanelMapping, Logo, PriceLabel, Brand, Promotion, BackgroundImage
-from PyPDF2 import PdfReader, PdfWriter
-from django.http import FileResponse, HttpResponse, HttpResponseForbidden
-from django.views.decorators.csrf import csrf_exempt
-from datetime import datetime, timedelta
+from .forms import SelectionForm, CoefficientForm, formula_help
+from .models import Configuration, Promotion
+from .datasheets import normalize_product_name
+from .filters import narrow_filters
+from .inventory import apply_delta, atomic_write_csv, csv_file_path, get_inventory, get_products, invalidate_inventory, inventory_version, last_payload_hash, publish_inventory, transliterate
+from .pdf import PriceListPDF
+from .price_list import build_price_list, write_excel
+from .pricing import add_price_labels, default_operation, frame_prices, simulation_grid, simulation_report
+from .products import get_configuration_products
+from .reference import reference_data
+from .result_cache import result_cache_stats
+from django.http import FileResponse, HttpResponse, HttpResponseForbidden, JsonResponse
+from django.views.decorators.csrf import csrf_exempt, csrf_protect
+from datetime import datetime
 from django.contrib import messages
 import logging
-from unidecode import unidecode
 from django.template.loader import render_to_string
 import csv
 
@@ -28,26 +37,13 @@ logger = logging.getLogger(__name__)
 
 # Constants
 BASE_DIR = settings.BASE_DIR
-csv_file_path = os.path.join(BASE_DIR, 'data', 'data.csv')
-csv_datasheet_file_path = os.path.join(BASE_DIR, 'data', 'datasheet.csv')
 logos_dir = os.path.join(BASE_DIR, 'logos')
-font_dir = os.path.join(BASE_DIR, 'price_list_app', 'static', 'fonts')
 output_dir = os.path.join(BASE_DIR, 'static', 'generated_files')
 
-
-df_links = pd.read_csv(csv_datasheet_file_path)
-product_links = dict(zip(df_links['Product Name'], df_links['link']))
-
 # Ensure the output directory exists
 if not os.path.exists(output_dir):
     os.makedirs(output_dir)
 
-numeric_columns = [
-    'available', 'available_cz', 'bp_eur', 'bp_eur_cz',
-    'panel_power', 'length', 'width', 'height', 'pcs_pal', 'pcs_ctn'
-]
-
-
 def import_promotions_from_csv(file_data):
     reader = csv.DictReader(file_data)
     for row in reader:
@@ -79,46 +75,15 @@ def upload_csv_view(request):
     return redirect('admin:app_list', app_label='price_list_app')
 
 def get_pricelabel_headers():
-    headers = {}
-    other_headers = {}
-    for item in PriceLabel.objects.all():
-        if item.product_group == 'Other':
-            other_headers = {
-                'price_label_1': item.price_label_1,
-                'price_label_2': item.price_label_2,
-                'price_label_3': item.price_label_3,
-                'price_label_4': item.price_label_4,
-            }
-        headers[item.product_group] = {
-            'price_label_1': item.price_label_1,
-            'price_label_2': item.price_label_2,
-            'price_label_3': item.price_label_3,
-            'price_label_4': item.price_label_4,
-        }
-    # Add fallback for groups not having specific headers
-    for group in headers:
-        for i in range(1, 5):
-            headers[group].setdefault(f'price_label_{i}', other_headers.get(f'price_label_{i}', f'price_label_{i}'))
-    headers['Other'] = other_headers  # Ensure 'Other' group is always included
-    return headers
+    return reference_data()['pricelabel_headers']
 
 def get_mappings():
-    nomenclature_mapping = {
-        item.key: item.value for item in NomenclatureMapping.objects.all()
-    }
-    panel_mapping = {
-        item.key: item.value for item in PanelMapping.objects.all()
-    }
-    return nomenclature_mapping, panel_mapping
+    data = reference_data()
+    return data['nomenclature_mapping'], data['panel_mapping']
 
 def read_csv():
-    df = pd.read_csv(csv_file_path)
-    for col in numeric_columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-    df[numeric_columns] = df[numeric_columns].fillna(0)
     nomenclature_mapping, _ = get_mappings()
-    df['Group'] = df['nomenclature_group'].apply(lambda x: nomenclature_mapping.get(x[:3], 'Unknown'))
-    return df
+    return get_inventory(nomenclature_mapping)
 
 def home(request):
     return render(request, 'price_list_app/home.html')
@@ -219,18 +184,13 @@ def input_coefficients(request, config_id):
     selected_groups = json.loads(config.selected_groups)
     num_prices = config.num_prices
     pricelabel_headers = get_pricelabel_headers()
+    price_labels = reference_data()['price_labels']
     default_config = {}
 
-    try:
-        other_defaults = PriceLabel.objects.get(product_group='Other')
-    except PriceLabel.DoesNotExist:
-        other_defaults = None
+    other_defaults = price_labels.get('Other')
 
     for group in selected_groups:
-        try:
-            price_label = PriceLabel.objects.get(product_group=group)
-        except PriceLabel.DoesNotExist:
-            price_label = other_defaults
+        price_label = price_labels.get(group, other_defaults)
 
         if price_label:
             default_config[group] = {
@@ -275,6 +235,8 @@ def input_coefficients(request, config_id):
                     coefficients[group][f'operation_{i}'] = form.cleaned_data[f'{group}_operation_{i}']
                     coefficients[group][f'coefficient_{i}'] = form.cleaned_data[f'{group}_coefficient_{i}']
                     coefficients[group][f'header_{i}'] = form.cleaned_data[f'{group}_header_{i}']
+                    if form.cleaned_data[f'{group}_formula_{i}']:
+                        coefficients[group][f'formula_{i}'] = form.cleaned_data[f'{group}_formula_{i}']
             config.coefficients = json.dumps(coefficients)
             config.save()
             return redirect('generate_files', config_id=config.id)
@@ -290,6 +252,7 @@ def input_coefficients(request, config_id):
                     "operation": f"{group}_operation_{i}",
                     "coefficient": f"{group}_coefficient_{i}",
                     "header": f"{group}_header_{i}",
+                    "formula": f"{group}_formula_{i}",
                     "default_header": default_config.get(group, {}).get(f'header_{i}', pricelabel_headers.get(group, {}).get(f'price_label_{i}', pricelabel_headers.get('Other', {}).get(f'price_label_{i}', f'price_label_{i}')))
                 } for i in range(1, num_prices + 1)
             ]
@@ -297,25 +260,10 @@ def input_coefficients(request, config_id):
     ]
 
     return render(request, 'price_list_app/input_coefficients.html',
-                  {'form': form, 'num_prices_range': range(1, num_prices + 1), 'dynamic_fields': dynamic_fields})
+                  {'form': form, 'num_prices_range': range(1, num_prices + 1), 'dynamic_fields': dynamic_fields, 'formula_help': formula_help})
 
 def load_logos():
-    logo_dict = {}
-    logos = Logo.objects.all()
-    for logo in logos:
-        logo_dict[os.path.splitext(logo.name)[0]] = logo.file.path
-    return logo_dict
-
-def convert_to_non_interlaced(image_path):
-    try:
-        with Image.open(image_path) as img:
-            if img.info.get('interlace'):
-                non_interlaced_path = image_path.replace('.png', '_non_interlaced.png')
-                img.save(non_interlaced_path, interlace=False)
-                return non_interlaced_path
-    except Exception as e:
-        logger.error(f"Error converting image: {e}")
-    return image_path
+    return reference_data()['logos']
 
 @login_required
 def generate_files(request, config_id):
@@ -330,131 +278,13 @@ def generate_files(request, config_id):
     coefficients = json.loads(config.coefficients)
     filters = json.loads(config.filters)
 
-    # Handle dynamic selection of brands
-    if config.select_all_brands:
-        selected_brands = list(Brand.objects.all().values_list('name', flat=True))
-    else:
-        selected_brands = json.loads(config.selected_brands)
-
-    df = read_csv()
-    df = df[df['Group'].isin(selected_groups)]
-    df = df[df['brand'].isin(selected_brands)]
-
-
-    # Apply filters
-    if filters.get('no_delivery_date'):
-        df = df[df['delivery_month'].isnull()]
-    else:
-        df['delivery_month'] = pd.to_datetime(df['delivery_month']).dt.strftime('%Y-%m')
-        if filters.get('delivery_month_start'):
-            df = df[df['delivery_month'] >= filters['delivery_month_start']]
-        if filters.get('delivery_month_end'):
-            df = df[df['delivery_month'] <= filters['delivery_month_end']]
-    if filters.get('panel_power_min') is not None:
-        df = df[df['panel_power'] >= filters['panel_power_min']]
-    if filters.get('panel_power_max') is not None:
-        df = df[df['panel_power'] <= filters['panel_power_max']]
-    if filters.get('panel_colour'):
-        df = df[df['panel_colour'].isin(filters['panel_colour'])]
-    if filters.get('panel_design'):
-        df = df[df['panel_design'].isin(filters['panel_design'])]
-    if filters.get('length_min') is not None:
-        df = df[df['length'] >= filters['length_min']]
-    if filters.get('length_max') is not None:
-        df = df[df['length'] <= filters['length_max']]
-    if filters.get('height_min') is not None:
-        df = df[df['height'] >= filters['height_min']]
-    if filters.get('height_max') is not None:
-        df = df[df['height'] <= filters['height_max']]
-    if filters.get('width_min') is not None:
-        df = df[df['width'] >= filters['width_min']]
-    if filters.get('width_max') is not None:
-        df = df[df['width'] <= filters['width_max']]
-    if filters.get('available') is not None:
-        df = df[df['available'] >= filters['available']]
-    if filters.get('power_available') is not None:
-        df['power_available'] = (df['available'] * df['panel_power']) / 1000
-        df = df[df['power_available'] >= filters['power_available']]
-
-    if filters.get('pal_available') is not None:
-        df = df[df['available']/df['pcs_pal']  >= filters['pal_available']]
-
-    if filters.get('ctn_available') is not None:
-        df = df[df['pcs_ctn'] >= 1]
-        df = df[df['available']/df['pcs_ctn'] >= filters['ctn_available']]
-
-    if filters.get('length_height_limit'):
-        def product_of_two_largest(row):
-            largest_two = sorted([row['length'], row['height'], row['width']], reverse=True)[:2]
-            return largest_two[0]/1000 * largest_two[1]/1000
-
-        df['product_of_two_largest'] = df.apply(product_of_two_largest, axis=1)
-        df = df[df['product_of_two_largest'] <= 2]
-        df = df.drop(columns=['product_of_two_largest'])
-
-    if filters.get('urgent_stocks'):
-        # Convert 'min_receipt_date' to a datetime format
-        df['min_receipt_date'] = pd.to_datetime(df['min_receipt_date'], unit='ms')
-
-        # Calculate the date two months ago from today
-        two_months_ago = datetime.today() - timedelta(days=60)
-
-        # Filter the DataFrame where the difference is greater than two months
-        df = df[df['min_receipt_date'] < two_months_ago]
-
-
-    _, panel_mapping = get_mappings()
-    df['panel_colour'] = df['panel_colour'].map(panel_mapping)
-    df['panel_design'] = df['panel_design'].map(panel_mapping)
-
-    def calculate_selling_price(bp_price, operation, coefficient):
-        if operation == "*":
-            return bp_price * coefficient
-        elif operation == "+":
-            return bp_price + coefficient
-    def apply_coefficients(row):
-        group = row['Group']
-        bp_price = row['bp_eur_cz'] if warehouse == 'Decin' else row['bp_eur']
-        for j in range(1, num_prices + 1):
-            op = coefficients.get(group, {}).get(f'operation_{j}', '*')
-            coeff = coefficients.get(group, {}).get(f'coefficient_{j}', 1.2)
-            price = calculate_selling_price(bp_price, op, coeff)
-            if group == 'Panels':
-                row[f'price_label_{j}'] = round(price, 4)
-            else:
-                row[f'price_label_{j}'] = round(price, 0)
-        return row
+    grouped_df = get_configuration_products(config, filters)
 
-    if warehouse == 'Decin':
-        df['available'] = df['available_cz']
-    else:
-        df['available'] = df['available'] - df['available_cz']
-
-    df = df[df['available'] > 0]
-    df = df.apply(apply_coefficients, axis=1)
-
-    for j in range(1, num_prices + 1):
-        price_col = f'price_label_{j}'
-        if price_col not in df.columns:
-            df[price_col] = 0
-
-    grouped_df = df.groupby(['Group', 'brand', 'product_name'], as_index=False).agg({
-        'available': 'sum',
-        'bp_eur': 'max',
-        **{f'price_label_{j}': 'max' for j in range(1, num_prices + 1)},
-        'delivery_month': 'first',
-        'delivery_cw': 'first',
-        'panel_power': 'first',
-        'panel_colour': 'first',
-        'panel_design': 'first',
-        'length': 'first',
-        'width': 'first',
-        'height': 'first',
-        'pcs_pal': 'first',
-        'pcs_ctn': 'first'
-    })
+    # Both operations are linear in the base price, so the highest price of a
+    # product's lines is reached at its lowest or highest base price. Formulas
+    # are priced from the highest base price alone.
+    grouped_df = add_price_labels(grouped_df, coefficients, num_prices, ['base_price_max', 'base_price_min'])
 
-    grouped_df = grouped_df[grouped_df['available'] > 0]
     custom_order = list(get_mappings()[0].values())
     grouped_df['Group'] = pd.Categorical(grouped_df['Group'], categories=custom_order, ordered=True)
     grouped_df = grouped_df.sort_values('Group').reset_index(drop=True)
@@ -469,358 +299,178 @@ def generate_files(request, config_id):
 
     selected_columns = json.loads(config.selected_columns)
     final_columns = ['Group', 'brand', 'product_name'] + selected_columns + [f'price_label_{j}' for j in range(1, num_prices + 1)]
-    final_df = grouped_df[final_columns]
-    final_df = final_df.astype(str)
-    empty_values = ['0', 'NaN', 'None', 'NULL', 'nan', '0.0']
-    final_df.replace(empty_values, "", inplace=True)
-
-    column_rename_dict = {
-        'Group': 'Product Group',
-        'brand': 'Brand',
-        'product_name': 'Product Name',
-        'available': 'Available',
-        'delivery_month': 'Delivery',
-        'delivery_cw': 'CW',
-        'panel_power': 'Power(W)',
-        'panel_colour': 'Colour',
-        'panel_design': 'Design',
-        'length': 'Length',
-        'width': 'Width',
-        'height': 'Height',
-        'pcs_pal': 'Pcs Pal',
-        'pcs_ctn': 'Pcs ctn',
-    }
+    price_list = build_price_list(grouped_df, final_columns, headers)
 
-    final_df.rename(columns=column_rename_dict, inplace=True)
-
-    def format_numbers(value):
-        try:
-            if float(value).is_integer():
-                return "{:,.0f}".format(float(value)).replace(",", " ")
-            else:
-                return "{:,.3f}".format(float(value)).replace(",", " ")
-        except ValueError:
-            return str(value)
-
-    final_df = final_df.applymap(format_numbers)
-
-    logo_dict = load_logos()
-
-    class PDF(FPDF):
-        def __init__(self, orientation='P', background_image=None):
-            super().__init__(orientation)
-            self.background_image = background_image
-            self.toc = []
-
-        def header(self):
-            if self.background_image:
-                self.image(self.background_image, x=0, y=0, w=self.w, h=self.h)
-            self.set_font('DejaVu', 'B', 10)
-            self.cell(0, 10, 'Price List', 0, 1, 'C')
-
-
-        def chapter_title(self, title, group=False):
-            if self.get_y() > self.h - 70:
-                self.add_page()
-            self.set_font('DejaVu', 'B', 10)
-            self.cell(0, 10, title, 0, 1, 'L')
-            self.ln(2)
-            link = self.add_link()
-            self.set_link(link, page=self.page_no())
-            if group:
-                self.toc.append((title, self.page_no(), link))
-            else:
-                self.toc.append((f"{self.current_group}: {title}", self.page_no(), link))
-
-        def chapter_body(self, body):
-            self.set_font('DejaVu', '', 8)
-            self.multi_cell(0, 10, body)
-            self.ln()
-
-        def add_banner(self, logo_filename, height=20):
-            if logo_filename in logo_dict:
-                logo_path = logo_dict[logo_filename]
-                if os.path.isfile(logo_path):
-                    logo_path = convert_to_non_interlaced(logo_path)
-                    self.image(logo_path, x=12, y=self.get_y(), h=height)
-            else:
-                logo_path = logo_dict["NANOSUN"]
-                if os.path.isfile(logo_path):
-                    logo_path = convert_to_non_interlaced(logo_path)
-                    self.image(logo_path, x=12, y=self.get_y(), h=height)
-            self.ln(height)
-
-        def add_table(self, dataframe, group, headers):
-            dataframe = dataframe.drop(columns=['Product Group', 'Brand'], errors='ignore')
-            dataframe = dataframe.loc[:, ~(dataframe == "").all()]
-            dataframe_copy = dataframe.copy()
-            for col in dataframe.columns:
-                if col in headers[group]:
-                    dataframe_copy.rename(columns={col: headers[group][col]}, inplace=True)
-
-            self.set_font('DejaVu', 'B', 7)
-            headers_list = dataframe_copy.columns.tolist()
-            page_width = self.w - 2 * self.l_margin
-            cell_widths = {}
-            for header in headers_list:
-                max_content_width = max(self.get_string_width(str(value)) for value in dataframe_copy[header]) + 4
-                header_width = self.get_string_width(header.replace('_', ' ').title()) + 4
-                cell_widths[header] = max(max_content_width, header_width)
-            if "Product Name" in cell_widths:
-                cell_widths["Product Name"] += 0.5 * self.get_string_width(' ')
-                cell_widths["Product Name"] += self.get_string_width(' ' * 3)
-            total_width = sum(cell_widths.values())
-            scale = page_width / total_width
-            for header in cell_widths:
-                cell_widths[header] *= scale
-
-            def split_text(text, cell_width, max_lines=2):
-                words = text.split(' ')
-                lines = []
-                current_line = words[0]
-                for word in words[1:]:
-                    if self.get_string_width(current_line + ' ' + word) <= cell_width - 4:
-                        current_line += ' ' + word
-                    else:
-                        lines.append(current_line)
-                        current_line = word
-                    if len(lines) >= max_lines - 1:
-                        break
-                lines.append(current_line)
-                if len(lines) > max_lines:
-                    lines = lines[:max_lines]
-                return lines
-
-            max_lines = 2
-            header_lines_dict = {}
-            for header in headers_list:
-                header_lines = split_text(header.replace('_', ' ').title(), cell_widths[header], max_lines=max_lines)
-                header_lines_dict[header] = header_lines
-                max_lines = max(max_lines, len(header_lines))
-
-            line_height = 5
-            header_height = max_lines * line_height
-            for header in headers_list:
-                if len(header_lines_dict[header]) > 1:
-                    cell_widths[header] *= 0.8
-            total_width = sum(cell_widths.values())
-            scale = page_width / total_width
-            for header in cell_widths:
-                cell_widths[header] *= scale
-
-            def draw_headers():
-                y_start = self.get_y()
-                for header in headers_list:
-                    x_start = self.get_x()
-                    for i, line in enumerate(header_lines_dict[header]):
-                        self.set_xy(x_start, y_start + i * line_height)
-                        self.cell(cell_widths[header], line_height, line, 0, 0, 'C')
-                    self.set_xy(x_start + cell_widths[header], y_start)
-                self.set_y(y_start + header_height)
-                self.set_y(y_start)
-                x_start = self.l_margin
-                for header in headers_list:
-                    self.set_xy(x_start, y_start)
-                    self.multi_cell(cell_widths[header], header_height, '', 1, 'C')
-                    x_start += cell_widths[header]
-
-            draw_headers()
-
-            self.set_font('DejaVu', '', 7)
-            for row in dataframe_copy.itertuples(index=False):
-                row_lines_dict = {}
-                max_row_lines = 1
-                for header in headers_list:
-                    cell_text = str(row[headers_list.index(header)])
-                    if header in ["Colour", "Product Name", "Design"]:
-                        row_lines = split_text(cell_text, cell_widths[header], max_lines=2)
-                    else:
-                        row_lines = [cell_text]
-                    row_lines_dict[header] = row_lines
-                    max_row_lines = max(max_row_lines, len(row_lines))
-
-                row_height = max_row_lines * line_height
-                y_start = self.get_y()
-                if y_start + row_height > self.page_break_trigger:
-                    self.add_page()
-                    draw_headers()
-                    y_start = self.get_y()
-                for header in headers_list:
-                    x_start = self.get_x()
-                    for i, line in enumerate(row_lines_dict[header]):
-                        self.set_xy(x_start, y_start + i * line_height)
-                        if header == 'Product Name':
-                            link = product_links.get(line)  # Fetch link from dictionary
-                            if link:
-                                pdf_link = self.add_link()
-                                self.set_link(pdf_link, page=self.page_no(), y=self.get_y())
-                                self.set_text_color(0, 0, 255)
-                                self.cell(cell_widths[header], line_height, line, 0, 0, 'C', link=link)
-                                self.set_text_color(0)
-                            else:
-                                self.cell(cell_widths[header], line_height, line, 0, 0, 'C')  # No link if not found
-                        else:
-                            self.cell(cell_widths[header], line_height, line, 0, 0, 'C')
-                        self.set_xy(x_start + cell_widths[header], y_start)
-
-                self.set_y(y_start + row_height)
-                self.set_y(y_start)
-                x_start = self.l_margin
-                for header in headers_list:
-                    self.set_xy(x_start, y_start)
-                    self.multi_cell(cell_widths[header], row_height, '', 1, 'C')
-                    x_start += cell_widths[header]
-
-        def add_toc_page(self):
-            max_pages = 2
-            initial_font_size = 10
-            data = self._prepare_data()
-            row_height = 6
-
-            while True:
-                self.set_auto_page_break(auto=True, margin=15)
-                self.add_page()
-                self._render_toc(data, initial_font_size, row_height)
-                pages_used = self.page_no()
-                if pages_used <= max_pages:
-                    break
-                initial_font_size -= 0.5
-                row_height -= 0.2
-                self._reset_document()
-            self.output(os.path.join(user_directory, 'table_of_contents.pdf'))
-
-        def _prepare_data(self):
-            data = []
-            temp_title = ""
-            for title, page, link in self.toc:
-                if ": " in title:
-                    group, brand = title.split(": ", 1)
-                    data.append([temp_title, brand, page])
-                    temp_title = ""
-                else:
-                    temp_title = title
-            return data
-
-        def _render_toc(self, data, font_size, row_height):
-            self.set_font('DejaVu', 'B', font_size)
-            self.cell(0, 8, 'Table of Contents', 0, 1, 'C')
-            self.ln(1)
-            self.set_font('DejaVu', '', font_size - 2)
-            col_width = (self.w - 2 * self.l_margin) / 3
-            for i, row in enumerate(data):
-                self.set_text_color(0, 0, 0)
-                self.set_font('DejaVu', 'B', font_size - 2)
-                self.cell(col_width, row_height, str(row[0]), 0, 0, 'L')
-                x_chapter_end = self.get_x()
-                self.cell(col_width, row_height, str(row[1]), 0, 0, 'L')
-                x_brand_end = self.get_x()
-                self.cell(col_width, row_height, str(row[2]), 0, 0, 'R')
-                x_page_end = self.get_x()
-                y = self.get_y() + row_height
-                self._draw_dashed_line(x_chapter_end, y, x_brand_end - x_chapter_end, row_height)
-                self._draw_dashed_line(x_brand_end, y, x_page_end - x_brand_end, row_height)
-                self.ln(row_height)
-            self.ln(2)
-
-        def _draw_dashed_line(self, x, y, width, height, dash_length=2):
-            self.set_draw_color(0, 0, 0)
-            self.set_line_width(0.2)
-            x_start = x
-            x_end = x + width
-            while x_start < x_end:
-                self.line(x_start, y, x_start + dash_length, y)
-                x_start += dash_length * 2
-
-        def _reset_document(self):
-            self.pages = []
-            self.page_no_ = 0
-            self.num_pages = 0
-            self._outlines = []
-            self._current_page = None
-            self.add_page()
     if filters.get('NoBackground'):
         toc_image = None
         content_image = None
     else:
         try:
-            background_image = BackgroundImage.objects.first()
+            background_image = reference_data()['background_image']
             toc_image = background_image.toc_image.path if background_image else None
             content_image = background_image.content_image.path if background_image else None
         except AttributeError:
             toc_image = None
             content_image = None
 
-    # Create PDF for content with content background image
-    pdf = PDF(orientation='L', background_image=content_image)
-    pdf.add_font('DejaVu', '', os.path.join(font_dir, 'DejaVuSans.ttf'), uni=True)
-    pdf.add_font('DejaVu', 'B', os.path.join(font_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-    pdf.add_font('DejaVu', 'I', os.path.join(font_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-
-    if 'Product Group' in final_df.columns:
-        for group, group_df in final_df.groupby('Product Group', sort=False):
-            pdf.add_page()
-            pdf.current_group = group
-            pdf.chapter_title(f"{group} Products", group=True)
-            for brand, brand_df in group_df.groupby('Brand'):
-                pdf.chapter_title(brand)
-                pdf.add_banner(brand)
-                pdf.ln(5)
-                pdf.add_table(brand_df, group, headers)
-                pdf.ln(10)
-
-    content_pdf_output = os.path.join(user_directory, 'content.pdf')
-    pdf.output(content_pdf_output)
-
+    pdf = PriceListPDF(orientation='L', background_image=content_image, logos=load_logos(), datasheet_links=True)
+    layout = pdf.layout_price_list(price_list)
     if not filters.get('NoTOC'):
-        toc_temp = PDF(orientation='L')
-        toc_temp.add_font('DejaVu', '', os.path.join(font_dir, 'DejaVuSans.ttf'), uni=True)
-        toc_temp.add_font('DejaVu', 'B', os.path.join(font_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-        toc_temp.add_font('DejaVu', 'I', os.path.join(font_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-        toc_temp.toc = pdf.toc
-        toc_temp.add_toc_page()
-
-        toc_temp_output = os.path.join(user_directory, 'toc_temp.pdf')
-        toc_temp.output(toc_temp_output)
-
-        toc_temp_reader = PdfReader(toc_temp_output)
-        toc_pages_count = len(toc_temp_reader.pages)
-
-        adjusted_toc = [(title, page + toc_pages_count, link) for title, page, link in pdf.toc]
+        pdf.add_table_of_contents(layout.toc(), background_image=toc_image)
+    pdf.add_price_list(layout)
+    pdf.save(os.path.join(user_directory, 'price_list_with_selling_prices.pdf'))
 
-        final_toc = PDF(orientation='L', background_image=toc_image)
-        final_toc.add_font('DejaVu', '', os.path.join(font_dir, 'DejaVuSans.ttf'), uni=True)
-        final_toc.add_font('DejaVu', 'B', os.path.join(font_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-        final_toc.add_font('DejaVu', 'I', os.path.join(font_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-        final_toc.toc = adjusted_toc
-        final_toc.add_toc_page()
-
-        final_toc_output = os.path.join(user_directory, 'final_toc.pdf')
-        final_toc.output(final_toc_output)
-
-        final_toc_reader = PdfReader(final_toc_output)
-        final_pdf_writer = PdfWriter()
+    excel_output = os.path.join(user_directory, 'price_list_with_selling_prices.xlsx')
+    write_excel(price_list, excel_output)
 
-        for page_num in range(len(final_toc_reader.pages)):
-            final_pdf_writer.add_page(final_toc_reader.pages[page_num])
+    return redirect('results')
 
-        content_pdf_reader = PdfReader(content_pdf_output)
-        for page_num in range(len(content_pdf_reader.pages)):
-            final_pdf_writer.add_page(content_pdf_reader.pages[page_num])
+def _json_value(value):
+    if pd.isna(value):
+        return None
+    return value.item() if isinstance(value, np.generic) else value
+
+def api_auth_required(view):
+    """Let a JSON API view be called with settings.PRICE_API_TOKEN as
+    "Authorization: Bearer <token>", or from a logged-in session. Token calls
+    skip the CSRF check, session calls keep it; failures are JSON 401/403."""
+    session_view = csrf_protect(view)
+
+    @csrf_exempt
+    @wraps(view)
+    def wrapper(request, *args, **kwargs):
+        authorization = request.headers.get('Authorization')
+        if authorization is not None:
+            token = settings.PRICE_API_TOKEN
+            scheme, _, received = authorization.partition(' ')
+            if not token or scheme != 'Bearer' or not hmac.compare_digest(received.encode(), token.encode()):
+                return JsonResponse({'error': 'Invalid API token'}, status=403)
+            return view(request, *args, **kwargs)
+        if not request.user.is_authenticated:
+            return JsonResponse({'error': 'Authentication required'}, status=401)
+        return session_view(request, *args, **kwargs)
+    return wrapper
+
+@api_auth_required
+def quote_api(request, config_id):
+    """Price products under a saved configuration without rendering anything.
+
+    GET ?product=<name>&product=... or POST a JSON body
+    {"products": [<name>, ...], "filters": {...}}; filters can only narrow
+    the configuration's own (see narrow_filters). Without products every product passing the
+    filters is returned. Product names are matched ignoring case and spacing.
+    """
+    config = get_object_or_404(Configuration, id=config_id)
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    elif request.method == 'GET':
+        payload = {'products': request.GET.getlist('product')}
+    else:
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not isinstance(payload, dict):
+        payload = {'products': None}
+    products = payload.get('products', [])
+    extra_filters = payload.get('filters')
+    if not isinstance(products, list) or not (extra_filters is None or isinstance(extra_filters, dict)):
+        return JsonResponse({'error': 'Expected {"products": [...], "filters": {...}}'}, status=400)
 
-        final_output = os.path.join(user_directory, 'price_list_with_selling_prices.pdf')
-        with open(final_output, 'wb') as f:
-            final_pdf_writer.write(f)
+    num_prices = config.num_prices
+    coefficients = json.loads(config.coefficients)
+    try:
+        filters = narrow_filters(json.loads(config.filters), extra_filters) if extra_filters else None
+        df = get_configuration_products(config, filters, copy=False)
+        missing = []
+        if products:
+            wanted = {normalize_product_name(name): name for name in products}
+            df = df[df['product_key'].isin(list(wanted))]
+            found = set(df['product_key'])
+            missing = [name for key, name in wanted.items() if key not in found]
+        prices = frame_prices(df, coefficients, num_prices, ['base_price_max', 'base_price_min'])
+    except (TypeError, ValueError) as e:
+        logger.error(f"Quote for configuration {config_id} failed: {e}")
+        return JsonResponse({'error': str(e)}, status=400)
+
+    columns = {
+        name: [_json_value(value) for value in df[name].tolist()]
+        for name in ['product_name', 'brand', 'Group', 'available', 'delivery_month', 'delivery_cw']
+    }
+    prices = [[_json_value(price) for price in row] for row in prices.tolist()]
+    results = []
+    for i, group in enumerate(columns['Group']):
+        group_coefficients = coefficients.get(group, {})
+        results.append({
+            'product_name': columns['product_name'][i],
+            'brand': columns['brand'][i],
+            'group': group,
+            'available': columns['available'][i],
+            'delivery_month': columns['delivery_month'][i],
+            'delivery_cw': columns['delivery_cw'][i],
+            'prices': [
+                {
+                    'label': group_coefficients.get(f'header_{j}', f'price_label_{j}'),
+                    'price': prices[i][j - 1],
+                }
+                for j in range(1, num_prices + 1)
+            ],
+        })
+    return JsonResponse({
+        'configuration': config.id,
+        'warehouse': config.warehouse,
+        'inventory_version': inventory_version(),
+        'products': results,
+        'missing': missing,
+        'result_cache': result_cache_stats(),
+    })
 
-        os.remove(content_pdf_output)
-        os.remove(toc_temp_output)
-        os.remove(final_toc_output)
+@api_auth_required
+def simulate_api(request, config_id):
+    """Compare coefficients for a saved configuration without rendering
+    anything.
+
+    GET ?operation=*&coefficient=1.1&coefficient=1.2... or POST a JSON body
+    {"operations": [...], "coefficients": [...], "filters": {...}}; every
+    operation is tried with every coefficient, on the products passing the
+    configuration's filters narrowed by the extra ones. Returns revenue, total margin
+    and price spread per scenario for each group and each group and brand.
+    """
+    config = get_object_or_404(Configuration, id=config_id)
+    if request.method == 'POST':
+        try:
+            payload = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'error': 'Invalid JSON body'}, status=400)
+    elif request.method == 'GET':
+        payload = {
+            'operations': request.GET.getlist('operation') or [default_operation],
+            'coefficients': request.GET.getlist('coefficient'),
+        }
     else:
-        os.rename(content_pdf_output, os.path.join(user_directory, 'price_list_with_selling_prices.pdf'))
-
-    excel_output = os.path.join(user_directory, 'price_list_with_selling_prices.xlsx')
-    final_df.to_excel(excel_output, index=False)
+        return JsonResponse({'error': 'Method not allowed'}, status=405)
+    if not isinstance(payload, dict):
+        payload = {}
+    operations = payload.get('operations', [default_operation])
+    grid = payload.get('coefficients')
+    extra_filters = payload.get('filters')
+    if not isinstance(operations, list) or not isinstance(grid, list) or not (extra_filters is None or isinstance(extra_filters, dict)):
+        return JsonResponse({'error': 'Expected {"operations": [...], "coefficients": [...], "filters": {...}}'}, status=400)
 
-    return redirect('results')
+    try:
+        filters = narrow_filters(json.loads(config.filters), extra_filters) if extra_filters else None
+        df = get_configuration_products(config, filters, copy=False)
+        report = simulation_report(df, simulation_grid(operations, grid))
+    except (TypeError, ValueError) as e:
+        logger.error(f"Simulation for configuration {config_id} failed: {e}")
+        return JsonResponse({'error': str(e)}, status=400)
+    return JsonResponse({
+        'configuration': config.id,
+        'warehouse': config.warehouse,
+        'inventory_version': inventory_version(),
+        'result_cache': result_cache_stats(),
+        **report,
+    })
 
 @login_required
 def download_pdf(request):
@@ -879,14 +529,45 @@ def update_csv_view(request):
                 logger.error("No data provided")
                 return HttpResponse("No data provided", status=400)
 
+            file_path = os.path.join(settings.BASE_DIR, 'data', file_name)
+            is_inventory = file_path == csv_file_path
+            payload_hash = hashlib.sha256(data.encode('utf-8')).hexdigest()
+            mode = request.POST.get('mode', 'full')
+
+            if mode == 'delta' and not is_inventory:
+                logger.error(f"Delta upload not supported for {file_name}")
+                return HttpResponse("Delta uploads are only supported for data.csv", status=400)
+
             try:
-                df = pd.read_json(data)
+                if is_inventory and payload_hash == last_payload_hash():
+                    return HttpResponse(f'{file_name} unchanged')
+
+                if mode == 'delta':
+                    # {"upserts": [<row>, ...], "deletes": [<attribute_2>, ...]}
+                    delta = json.loads(data)
+                    if not isinstance(delta, dict) or not all(isinstance(delta.get(part, []), list) for part in ('upserts', 'deletes')):
+                        logger.error(f"Delta upload for {file_name} has no upserts and deletes lists")
+                        return HttpResponse("A delta needs upserts and deletes lists", status=400)
+                    upserts = pd.DataFrame(delta.get('upserts', []))
+                    if len(upserts) and ('attribute_2' not in upserts or upserts['attribute_2'].isna().any()):
+                        logger.error(f"Delta upload for {file_name} has upserts without attribute_2")
+                        return HttpResponse("Every upserted row needs an attribute_2", status=400)
+                    upserts, skipped = transliterate(upserts)
+                    deletes = delta.get('deletes', [])
+                    apply_delta(upserts, deletes, payload_hash)
+                    logger.info(f"Applied delta to {file_name}: {len(upserts)} upserts, {len(deletes)} deletes")
+                else:
+                    df = pd.read_json(data)
 
-                # Convert all strings in the dataframe to ASCII equivalents
-                df = df.applymap(lambda x: unidecode(x) if isinstance(x, str) else x)
+                    # Convert all strings in the dataframe to ASCII equivalents
+                    df, skipped = transliterate(df)
 
-                csv_file_path = os.path.join(settings.BASE_DIR, 'data', file_name)
-                df.to_csv(csv_file_path, index=False, encoding='latin-1')
+                    if is_inventory:
+                        publish_inventory(df, payload_hash)
+                    else:
+                        atomic_write_csv(df, file_path)
+                logger.info(f"Transliteration of {file_name} skipped {skipped} cells")
+                invalidate_inventory()
                 return HttpResponse(f'{file_name} updated successfully')
             except Exception as e:
                 logger.error(f"An error occurred: {e}")
@@ -907,16 +588,7 @@ def promotion_results(request):
 
 @login_required
 def view_reservation_table(request):
-    df = pd.read_csv(csv_file_path)
-
-    for col in numeric_columns:
-        df[col] = pd.to_numeric(df[col], errors='coerce')
-
-    df[numeric_columns] = df[numeric_columns].fillna(0)
-
-    nomenclature_mapping, _ = get_mappings()
-
-    df['Group'] = df['nomenclature_group'].apply(lambda x: nomenclature_mapping.get(x[:3], 'Unknown'))
+    df = read_csv()
 
     # Filter the DataFrame to include only the specified columns
     df = df[['product_name', 'available', 'available_cz', 'brand', 'Group']]
@@ -937,34 +609,19 @@ def generate_promotion_pricelist(request):
         promotions = Promotion.objects.all()
         promotion_dict = {promo.product_name: promo.selling_price for promo in promotions}
 
-        df = read_csv()
+        nomenclature_mapping, _ = get_mappings()
+        grouped_df = get_products(nomenclature_mapping, 'Decin')
 
-        # Filter the DataFrame to include only products in the Promotion model
-        df = df[df['product_name'].isin(promotion_dict.keys())]
+        # Filter the products to include only those in the Promotion model
+        grouped_df = grouped_df[grouped_df['product_name'].isin(promotion_dict.keys())].rename(columns={'available': 'available_cz'})
 
         # Adding the Promotion Price to the DataFrame
-        df['Price'] = df['product_name'].map(promotion_dict)
+        grouped_df['Price'] = grouped_df['product_name'].map(promotion_dict)
+        grouped_df['delivery_month'] = grouped_df['delivery_month'].cat.rename_categories(lambda month: f'{month[5:]}/{month[:4]}')
 
         availability_column = 'available_cz'
-        df = df[df[availability_column] > 0]
-
-        grouped_df = df.groupby(['Group', 'brand', 'product_name'], as_index=False).agg({
-            'available_cz': 'sum',
-            'Price': 'max',
-            'delivery_month': 'first',
-            'delivery_cw': 'first',
-            'panel_power': 'first',
-            'panel_colour': 'first',
-            'panel_design': 'first',
-            'length': 'first',
-            'width': 'first',
-            'height': 'first',
-            'pcs_pal': 'first',
-            'pcs_ctn': 'first'
-        })
-
         grouped_df = grouped_df[grouped_df[availability_column] > 0]
-        custom_order = list(get_mappings()[0].values())
+        custom_order = list(nomenclature_mapping.values())
         grouped_df['Group'] = pd.Categorical(grouped_df['Group'], categories=custom_order, ordered=True)
         grouped_df = grouped_df.sort_values('Group').reset_index(drop=True)
 
@@ -973,335 +630,24 @@ def generate_promotion_pricelist(request):
             'panel_power', 'panel_colour', 'panel_design', 'length', 'width', 'height', 'pcs_pal', 'pcs_ctn', 'Price'
         ]
 
-        final_df = grouped_df[final_columns]
-        final_df = final_df.astype(str)
-        empty_values = ['0', 'NaN', 'None', 'NULL', 'nan', '0.0']
-        final_df.replace(empty_values, "", inplace=True)
-
-        column_rename_dict = {
-            'Group': 'Product Group',
-            'brand': 'Brand',
-            'product_name': 'Product Name',
-            'available_cz': 'Available',
-            'delivery_month': 'Delivery',
-            'delivery_cw': 'CW',
-            'panel_power': 'Power(W)',
-            'panel_colour': 'Colour',
-            'panel_design': 'Design',
-            'length': 'Length',
-            'width': 'Width',
-            'height': 'Height',
-            'pcs_pal': 'Pcs Pal',
-            'pcs_ctn': 'Pcs ctn',
-            'Price': 'Price'
-        }
-
-        final_df.rename(columns=column_rename_dict, inplace=True)
-
-        def format_numbers(value):
-            try:
-                if float(value).is_integer():
-                    return "{:,.0f}".format(float(value)).replace(",", " ")
-                else:
-                    return "{:,.3f}".format(float(value)).replace(",", " ")
-            except ValueError:
-                return str(value)
-
-        final_df = final_df.applymap(format_numbers)
-
-        logo_dict = load_logos()
-        class PDF(FPDF):
-            def __init__(self, orientation='P', background_image=None):
-                super().__init__(orientation)
-                self.background_image = background_image
-                self.toc = []
-
-            def header(self):
-                if self.background_image:
-                    self.image(self.background_image, x=0, y=0, w=self.w, h=self.h)
-                self.set_font('DejaVu', 'B', 10)
-                self.cell(0, 10, 'Price List', 0, 1, 'C')
-
-
-            def chapter_title(self, title, group=False):
-                if self.get_y() > self.h - 70:
-                    self.add_page()
-                self.set_font('DejaVu', 'B', 10)
-                self.cell(0, 10, title, 0, 1, 'L')
-                self.ln(2)
-                link = self.add_link()
-                self.set_link(link, page=self.page_no())
-                if group:
-                    self.toc.append((title, self.page_no(), link))
-                else:
-                    self.toc.append((f"{self.current_group}: {title}", self.page_no(), link))
-
-            def chapter_body(self, body):
-                self.set_font('DejaVu', '', 8)
-                self.multi_cell(0, 10, body)
-                self.ln()
-
-            def add_banner(self, logo_filename, height=20):
-                if logo_filename in logo_dict:
-                    logo_path = logo_dict[logo_filename]
-                    if os.path.isfile(logo_path):
-                        logo_path = convert_to_non_interlaced(logo_path)
-                        self.image(logo_path, x=12, y=self.get_y(), h=height)
-                else:
-                    logo_path = logo_dict["NANOSUN"]
-                    if os.path.isfile(logo_path):
-                        logo_path = convert_to_non_interlaced(logo_path)
-                        self.image(logo_path, x=12, y=self.get_y(), h=height)
-                self.ln(height)
-
-            def add_table(self, dataframe, group):
-                dataframe = dataframe.drop(columns=['Product Group', 'Brand'], errors='ignore')
-                dataframe = dataframe.loc[:, ~(dataframe == "").all()]
-                dataframe_copy = dataframe.copy()
-                dataframe_copy.rename(columns={'Price': 'Price'}, inplace=True)
-
-                self.set_font('DejaVu', 'B', 7)
-                headers_list = dataframe_copy.columns.tolist()
-                page_width = self.w - 2 * self.l_margin
-                cell_widths = {}
-                for header in headers_list:
-                    max_content_width = max(self.get_string_width(str(value)) for value in dataframe_copy[header]) + 4
-                    header_width = self.get_string_width(header.replace('_', ' ').title()) + 4
-                    cell_widths[header] = max(max_content_width, header_width)
-                if "Product Name" in cell_widths:
-                    cell_widths["Product Name"] += 0.5 * self.get_string_width(' ')
-                    cell_widths["Product Name"] += self.get_string_width(' ' * 3)
-                total_width = sum(cell_widths.values())
-                scale = page_width / total_width
-                for header in cell_widths:
-                    cell_widths[header] *= scale
-
-                def split_text(text, cell_width, max_lines=2):
-                    words = text.split(' ')
-                    lines = []
-                    current_line = words[0]
-                    for word in words[1:]:
-                        if self.get_string_width(current_line + ' ' + word) <= cell_width - 4:
-                            current_line += ' ' + word
-                        else:
-                            lines.append(current_line)
-                            current_line = word
-                        if len(lines) >= max_lines - 1:
-                            break
-                    lines.append(current_line)
-                    if len(lines) > max_lines:
-                        lines = lines[:max_lines]
-                    return lines
-
-                max_lines = 2
-                header_lines_dict = {}
-                for header in headers_list:
-                    header_lines = split_text(header.replace('_', ' ').title(), cell_widths[header], max_lines=max_lines)
-                    header_lines_dict[header] = header_lines
-                    max_lines = max(max_lines, len(header_lines))
-
-                line_height = 5
-                header_height = max_lines * line_height
-                for header in headers_list:
-                    if len(header_lines_dict[header]) > 1:
-                        cell_widths[header] *= 0.8
-                total_width = sum(cell_widths.values())
-                scale = page_width / total_width
-                for header in cell_widths:
-                    cell_widths[header] *= scale
-
-                def draw_headers():
-                    y_start = self.get_y()
-                    for header in headers_list:
-                        x_start = self.get_x()
-                        for i, line in enumerate(header_lines_dict[header]):
-                            self.set_xy(x_start, y_start + i * line_height)
-                            self.cell(cell_widths[header], line_height, line, 0, 0, 'C')
-                        self.set_xy(x_start + cell_widths[header], y_start)
-                    self.set_y(y_start + header_height)
-                    self.set_y(y_start)
-                    x_start = self.l_margin
-                    for header in headers_list:
-                        self.set_xy(x_start, y_start)
-                        self.multi_cell(cell_widths[header], header_height, '', 1, 'C')
-                        x_start += cell_widths[header]
-
-                draw_headers()
-
-                self.set_font('DejaVu', '', 7)
-                for row in dataframe_copy.itertuples(index=False):
-                    row_lines_dict = {}
-                    max_row_lines = 1
-                    for header in headers_list:
-                        cell_text = str(row[headers_list.index(header)])
-                        if header in ["Colour", "Product Name", "Design"]:
-                            row_lines = split_text(cell_text, cell_widths[header], max_lines=2)
-                        else:
-                            row_lines = [cell_text]
-                        row_lines_dict[header] = row_lines
-                        max_row_lines = max(max_row_lines, len(row_lines))
-
-                    row_height = max_row_lines * line_height
-                    y_start = self.get_y()
-                    if y_start + row_height > self.page_break_trigger:
-                        self.add_page()
-                        draw_headers()
-                        y_start = self.get_y()
-                    for header in headers_list:
-                        x_start = self.get_x()
-                        for i, line in enumerate(row_lines_dict[header]):
-                            self.set_xy(x_start, y_start + i * line_height)
-                            self.cell(cell_widths[header], line_height, line, 0, 0, 'C')
-                        self.set_xy(x_start + cell_widths[header], y_start)
-
-                    self.set_y(y_start + row_height)
-                    self.set_y(y_start)
-                    x_start = self.l_margin
-                    for header in headers_list:
-                        self.set_xy(x_start, y_start)
-                        self.multi_cell(cell_widths[header], row_height, '', 1, 'C')
-                        x_start += cell_widths[header]
-
-            def add_toc_page(self):
-                max_pages = 2
-                initial_font_size = 10
-                data = self._prepare_data()
-                row_height = 6
-
-                while True:
-                    self.set_auto_page_break(auto=True, margin=15)
-                    self.add_page()
-                    self._render_toc(data, initial_font_size, row_height)
-                    pages_used = self.page_no()
-                    if pages_used <= max_pages:
-                        break
-                    initial_font_size -= 0.5
-                    row_height -= 0.2
-                    self._reset_document()
-
-            def _prepare_data(self):
-                data = []
-                temp_title = ""
-                for title, page, link in self.toc:
-                    if ": " in title:
-                        group, brand = title.split(": ", 1)
-                        data.append([temp_title, brand, page])
-                        temp_title = ""
-                    else:
-                        temp_title = title
-                return data
-
-            def _render_toc(self, data, font_size, row_height):
-                self.set_font('DejaVu', 'B', font_size)
-                self.cell(0, 8, 'Table of Contents', 0, 1, 'C')
-                self.ln(1)
-                self.set_font('DejaVu', '', font_size - 2)
-                col_width = (self.w - 2 * self.l_margin) / 3
-                for i, row in enumerate(data):
-                    self.set_text_color(0, 0, 0)
-                    self.set_font('DejaVu', 'B', font_size - 2)
-                    self.cell(col_width, row_height, str(row[0]), 0, 0, 'L')
-                    x_chapter_end = self.get_x()
-                    self.cell(col_width, row_height, str(row[1]), 0, 0, 'L')
-                    x_brand_end = self.get_x()
-                    self.cell(col_width, row_height, str(row[2]), 0, 0, 'R')
-                    x_page_end = self.get_x()
-                    y = self.get_y() + row_height
-                    self._draw_dashed_line(x_chapter_end, y, x_brand_end - x_chapter_end, row_height)
-                    self._draw_dashed_line(x_brand_end, y, x_page_end - x_brand_end, row_height)
-                    self.ln(row_height)
-                self.ln(2)
-
-            def _draw_dashed_line(self, x, y, width, height, dash_length=2):
-                self.set_draw_color(0, 0, 0)
-                self.set_line_width(0.2)
-                x_start = x
-                x_end = x + width
-                while x_start < x_end:
-                    self.line(x_start, y, x_start + dash_length, y)
-                    x_start += dash_length * 2
-
-            def _reset_document(self):
-                self.pages = []
-                self.page_no_ = 0
-                self.num_pages = 0
-                self._outlines = []
-                self._current_page = None
-                self.add_page()
+        price_list = build_price_list(grouped_df, final_columns)
 
         try:
-            background_image = BackgroundImage.objects.first()
+            background_image = reference_data()['background_image']
             toc_image = background_image.toc_image.path if background_image else None
             content_image = background_image.content_image.path if background_image else None
         except AttributeError:
             toc_image = None
             content_image = None
 
-        pdf = PDF(orientation='L', background_image=content_image)
-        pdf.add_font('DejaVu', '', os.path.join(font_dir, 'DejaVuSans.ttf'), uni=True)
-        pdf.add_font('DejaVu', 'B', os.path.join(font_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-        pdf.add_font('DejaVu', 'I', os.path.join(font_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-
-        if 'Product Group' in final_df.columns:
-            for group, group_df in final_df.groupby('Product Group', sort=False):
-                pdf.add_page()
-                pdf.current_group = group
-                pdf.chapter_title(f"{group} Products", group=True)
-                for brand, brand_df in group_df.groupby('Brand'):
-                    pdf.chapter_title(brand)
-                    pdf.add_banner(brand)
-                    pdf.ln(5)
-                    pdf.add_table(brand_df, group)
-                    pdf.ln(10)
-
-        content_pdf_output = os.path.join(output_dir, 'content.pdf')
-        pdf.output(content_pdf_output)
-
-        toc_temp = PDF(orientation='L')
-        toc_temp.add_font('DejaVu', '', os.path.join(font_dir, 'DejaVuSans.ttf'), uni=True)
-        toc_temp.add_font('DejaVu', 'B', os.path.join(font_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-        toc_temp.add_font('DejaVu', 'I', os.path.join(font_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-        toc_temp.toc = pdf.toc
-        toc_temp.add_toc_page()
-
-        toc_temp_output = os.path.join(output_dir, 'toc_temp.pdf')
-        toc_temp.output(toc_temp_output)
-
-        toc_temp_reader = PdfReader(toc_temp_output)
-        toc_pages_count = len(toc_temp_reader.pages)
-
-        adjusted_toc = [(title, page + toc_pages_count, link) for title, page, link in pdf.toc]
-
-        final_toc = PDF(orientation='L', background_image=toc_image)
-        final_toc.add_font('DejaVu', '', os.path.join(font_dir, 'DejaVuSans.ttf'), uni=True)
-        final_toc.add_font('DejaVu', 'B', os.path.join(font_dir, 'DejaVuSans-Bold.ttf'), uni=True)
-        final_toc.add_font('DejaVu', 'I', os.path.join(font_dir, 'DejaVuSans-Oblique.ttf'), uni=True)
-        final_toc.toc = adjusted_toc
-        final_toc.add_toc_page()
-
-        final_toc_output = os.path.join(output_dir, 'final_toc.pdf')
-        final_toc.output(final_toc_output)
-
-        final_toc_reader = PdfReader(final_toc_output)
-        content_pdf_reader = PdfReader(content_pdf_output)
-        final_pdf_writer = PdfWriter()
-
-        for page_num in range(len(final_toc_reader.pages)):
-            final_pdf_writer.add_page(final_toc_reader.pages[page_num])
-
-        for page_num in range(len(content_pdf_reader.pages)):
-            final_pdf_writer.add_page(content_pdf_reader.pages[page_num])
-
-        final_output = os.path.join(output_dir, 'price_list_with_selling_prices.pdf')
-        with open(final_output, 'wb') as f:
-            final_pdf_writer.write(f)
-
-        os.remove(content_pdf_output)
-        os.remove(toc_temp_output)
-        os.remove(final_toc_output)
+        pdf = PriceListPDF(orientation='L', background_image=content_image, logos=load_logos())
+        layout = pdf.layout_price_list(price_list)
+        pdf.add_table_of_contents(layout.toc(), background_image=toc_image)
+        pdf.add_price_list(layout)
+        pdf.save(os.path.join(output_dir, 'price_list_with_selling_prices.pdf'))
 
         excel_output = os.path.join(output_dir, 'price_list_with_selling_prices.xlsx')
-        final_df.to_excel(excel_output, index=False)
+        write_excel(price_list, excel_output)
 
         return redirect('promotion_results')
 
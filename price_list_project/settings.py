@@ -127,6 +127,18 @@ STATICFILES_DIRS = [
 # Directory where the font files are stored
 FONT_DIR = BASE_DIR / 'price_list_app' / 'static' / 'fonts'
 
+# Mirror the published inventory into the InventoryItem table and let
+# generate_files load only the rows matching a configuration's filters
+INVENTORY_DATABASE = os.environ.get('INVENTORY_DATABASE', '') == '1'
+
+# Memory budget of the per-process cache of filtered and aggregated
+# inventory frames used by generate_files
+RESULT_CACHE_BYTES = int(os.environ.get('RESULT_CACHE_BYTES', 64 * 1024 * 1024))
+
+# Token clients of the JSON APIs (quote, simulate) send as
+# "Authorization: Bearer <token>"; empty disables token access
+PRICE_API_TOKEN = os.environ.get('PRICE_API_TOKEN', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 